@@ -1,10 +1,16 @@
 import os
-from math import ceil
+from math import ceil, floor
+from functools import wraps
+from datetime import datetime, timezone
 from waitress import serve
-from flask import Flask, request, render_template, send_from_directory,  redirect, url_for, jsonify
+from flask import Flask, request, render_template, send_from_directory,  redirect, url_for, jsonify, make_response, g
 
 
 from load_data import MediaItem
+from db_connect import get_db_connection, init_app
+from cache import VersionedCache
+from library_state import get_generation, bump_generation, changed_at
+from progress import progress
 from database_create import create_database
 from directory_manager import create_settings, create_or_update_path
 from watchdog_scanner import start_watchdog
@@ -17,6 +23,7 @@ from library_manager import library_manager
 
 
 app = Flask(__name__)
+init_app(app)
 
 def format_duration(minutes):
     """Converts minutes to hours and minutes format."""
@@ -40,10 +47,51 @@ def format_duration(minutes):
 app.jinja_env.filters['format_duration'] = format_duration
 
 
-
-
-
-
+def conditional(*scopes):
+    """
+    ETag / Last-Modified validators derived from the library_state generations in `scopes`.
+    A request whose validator still matches gets a 304 before the view runs (no SQLite, no Jinja).
+    A view that fell back to an empty page calls not_cacheable(), that response gets no validators.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = '-'.join(f'{scope[0]}{get_generation(scope)}' for scope in scopes)
+            modified = max(changed_at(scope) for scope in scopes)
+            # HTTP dates have 1s resolution; only advertise one when a later change can't share its second
+            last_modified = floor(modified) + 1
+            if last_modified > datetime.now(timezone.utc).timestamp():
+                last_modified = None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = bool(since and last_modified and since.timestamp() >= last_modified)
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if g.get('not_cacheable'):
+                    # A fallback must not be revalidated into a 304 until the next generation
+                    response.cache_control.no_store = True
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = datetime.fromtimestamp(last_modified, timezone.utc)
+            response.cache_control.no_cache = True     # always revalidate, the 304 is cheap
+            return response
+        return wrapper
+    return decorator
+
+
+def not_cacheable():
+    """The response being built is a fallback, not rendered from data -- see conditional()."""
+    g.not_cacheable = True
 
 
 @app.route('/favicon.ico')
@@ -52,25 +100,38 @@ def favicon():
 
 
 
+# Rendered pages that only change when the library does, keyed on the library generation
+page_cache = VersionedCache()
+
+
 @app.route('/')
 @app.route('/index')
+@conditional('library')
 def index():
     try:
-        # Limit the number of media items to 20
-        media_items = MediaItem.load_media_with_limit(20)
-        movies = MediaItem.load_media_with_limit(20, 'movie')
-        series = MediaItem.load_media_with_limit(20, 'series')
+        # Rebuilt once per library generation, concurrent cold requests wait for the same render
+        return page_cache.get_or_build('index', get_generation(), render_index)
 
     except Exception as e:
-        media_items = []
         print(f"Failed to load data: {e}")
 
+    not_cacheable()
+    return render_template('index.html', media_items=[], movies=[], series=[])
+
+
+def render_index():
+    # Limit the number of media items to 20
+    media_items = MediaItem.load_media_with_limit(20)
+    movies = MediaItem.load_media_with_limit(20, 'movie')
+    series = MediaItem.load_media_with_limit(20, 'series')
+
     return render_template('index.html', media_items=media_items, movies=movies, series=series)
 
 
 
 
 @app.route('/new')
+@conditional('library')
 def recently_added_page():
     try:
         # Get the current page number from the query parameter, default to 1
@@ -82,21 +143,28 @@ def recently_added_page():
         # Calculate the offset
         offset = (page - 1) * items_per_page
 
+        # Opaque keyset token from the Previous / Next links; plain ?page=N links fall back to the offset
+        page_token = request.args.get('cursor')
+
         # Fetch media items for the current page, limiting the results
-        media_items = MediaItem.load_recently_added_page_with_limit_and_offset(items_per_page, offset)
+        media_items = MediaItem.load_recently_added_page_with_limit_and_offset(items_per_page, offset, page_token)
+        prev_token, next_token = MediaItem.page_tokens(media_items, 'entry_updated')
         # Get the total count of media items to calculate the number of pages
         total_items = MediaItem.get_total_media_count()
         total_pages = (total_items // items_per_page) + (1 if total_items % items_per_page else 0)
 
     except Exception as e:
         media_items = []
+        prev_token = next_token = None
         total_pages = 1  # Set at least one page if something fails
         print(f"Failed to load data: {e}")
+        not_cacheable()
 
-    return render_template('recently_added_page.html', media_items=media_items, total_pages=total_pages, current_page=page)
+    return render_template('recently_added_page.html', media_items=media_items, total_pages=total_pages, current_page=page, prev_token=prev_token, next_token=next_token)
 
 
 @app.route('/movies')
+@conditional('library')
 def movies_page():
     try:
         # Get the current page number from the query parameter, default to 1
@@ -108,21 +176,28 @@ def movies_page():
         # Calculate the offset
         offset = (page - 1) * items_per_page
 
+        # Opaque keyset token from the Previous / Next links; plain ?page=N links fall back to the offset
+        page_token = request.args.get('cursor')
+
         # Fetch media items for the current page, limiting the results
-        media_items = MediaItem.load_movies_only_with_limit_and_offset(items_per_page, offset)
+        media_items = MediaItem.load_movies_only_with_limit_and_offset(items_per_page, offset, page_token)
+        prev_token, next_token = MediaItem.page_tokens(media_items, 'title')
         # Get the total count of media items to calculate the number of pages
         total_items = MediaItem.get_total_media_count(category='movie')
         total_pages = (total_items // items_per_page) + (1 if total_items % items_per_page else 0)
 
     except Exception as e:
         media_items = []
+        prev_token = next_token = None
         total_pages = 1  # Set at least one page if something fails
         print(f"Failed to load data: {e}")
+        not_cacheable()
 
-    return render_template('movies_page.html', media_items=media_items, total_pages=total_pages, current_page=page)
+    return render_template('movies_page.html', media_items=media_items, total_pages=total_pages, current_page=page, prev_token=prev_token, next_token=next_token)
 
 
 @app.route('/series')
+@conditional('library')
 def series_page():
     try:
         # Get the current page number from the query parameter, default to 1
@@ -134,24 +209,31 @@ def series_page():
         # Calculate the offset
         offset = (page - 1) * items_per_page
 
+        # Opaque keyset token from the Previous / Next links; plain ?page=N links fall back to the offset
+        page_token = request.args.get('cursor')
+
         # Fetch media items for the current page, limiting the results
-        media_items = MediaItem.load_series_only_with_limit_and_offset(items_per_page, offset)
+        media_items = MediaItem.load_series_only_with_limit_and_offset(items_per_page, offset, page_token)
+        prev_token, next_token = MediaItem.page_tokens(media_items, 'title')
         # Get the total count of media items to calculate the number of pages
         total_items = MediaItem.get_total_media_count(category='series')
         total_pages = (total_items // items_per_page) + (1 if total_items % items_per_page else 0)
 
     except Exception as e:
         media_items = []
+        prev_token = next_token = None
 
 
         total_pages = 1  # Set at least one page if something fails
         print(f"Failed to load data: {e}")
+        not_cacheable()
 
-    return render_template('series_page.html', media_items=media_items, total_pages=total_pages, current_page=page)
+    return render_template('series_page.html', media_items=media_items, total_pages=total_pages, current_page=page, prev_token=prev_token, next_token=next_token)
 
 
 
 @app.route('/watchlist')
+@conditional('library', 'user')
 def watchlist():
     try:
         conn = get_db_connection()
@@ -166,11 +248,13 @@ def watchlist():
     except Exception as e:
         media_items = []
         print(f"Failed to load data: {e}")
+        not_cacheable()
 
     return render_template('watchlist_page.html', media_items=media_items)
 
 
 @app.route('/<int:item_id>/<title>')
+@conditional('library')
 def details_page(item_id, title):
 
     try:    
@@ -179,6 +263,7 @@ def details_page(item_id, title):
     except Exception as e:
         media_items = []
         print(f"[ 10 ] Failed to load data: {e}")
+        not_cacheable()
     
     return render_template('item_page.html', media_items=media_items, item_id=item_id, title=title, duration=duration)
 
@@ -211,6 +296,15 @@ def settings():
 
 
 
+@app.route('/api/progress', methods=['GET'])
+def ingest_progress():
+    """Scan / ingest progress per stage, polled by the status panel on the settings page."""
+    response = jsonify(stages=progress.snapshot(), generated_at=datetime.now(timezone.utc).timestamp())
+    response.cache_control.no_store = True
+    return response
+
+
+
 @app.route('/search', methods=['GET'])
 def search_page():
     return render_template('search.html')
@@ -218,6 +312,7 @@ def search_page():
 
 
 @app.route('/search/results', methods=['GET'])
+@conditional('library')
 def search_results():
     query = request.args.get('query', '')  # Get the 'query' parameter from the URL
     results_list = []
@@ -231,14 +326,18 @@ def search_results():
     return jsonify(results=results_list)
 
 
-from db_connect import get_db_connection
+def resolve_file_hash_key(cursor, key):
+    """Maps a file_hash_key from before the fingerprint v2 migration to the current one."""
+    alias = cursor.execute('''SELECT file_hash_key FROM file_hash_aliases WHERE old_key = ?''', (key,)).fetchone()
+    return alias[0] if alias else key
+
 
 @app.route('/watch/v')
 def watch():
     path = request.args.get('path')
     conn = get_db_connection()
     cursor = conn.cursor()
-    item = cursor.execute('''SELECT * FROM media_metadata WHERE file_hash_key = ?''', (path,)).fetchone()
+    item = cursor.execute('''SELECT * FROM media_metadata WHERE file_hash_key = ?''', (resolve_file_hash_key(cursor, path),)).fetchone()
     
     conn.close()
     
@@ -260,7 +359,7 @@ def subtitles():
     path = request.args.get('path')
     conn = get_db_connection()
     cursor = conn.cursor()
-    item = cursor.execute('''SELECT * FROM media_metadata WHERE file_hash_key = ?''', (path,)).fetchone()
+    item = cursor.execute('''SELECT * FROM media_metadata WHERE file_hash_key = ?''', (resolve_file_hash_key(cursor, path),)).fetchone()
     subtitles = cursor.execute('''SELECT subtitle_path FROM media_subtitles WHERE media_metadata_id = ?''', (item['id'],)).fetchall()
     conn.close()
 
@@ -276,6 +375,10 @@ def watch_page():
     path = request.args.get('path')
     conn = get_db_connection()
     cursor = conn.cursor()
+    current = resolve_file_hash_key(cursor, path)
+    if current != path:
+        conn.close()
+        return redirect(url_for('watch_page', path=current), code=301)
     item = cursor.execute('''SELECT media_item_id, season, episode FROM media_metadata WHERE file_hash_key = ?''', (path,)).fetchone()
     title = cursor.execute('''SELECT title FROM media_items WHERE id = ?''', (item[0],)).fetchone()[0]
     conn.close()
@@ -316,6 +419,7 @@ def submit_rating():
 
         conn.commit()
         conn.close()
+        bump_generation('user')
 
         return jsonify({"message": "Rating submitted successfully!"}), 200
     else:
@@ -323,6 +427,7 @@ def submit_rating():
 
 
 @app.route('/get_rating/<int:item_id>', methods=['GET'])
+@conditional('user')
 def get_rating(item_id):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -367,6 +472,7 @@ def submit_liked():
 
         conn.commit()
         conn.close()
+        bump_generation('user')
 
         return jsonify({"message": "Like submitted successfully!"}), 200
     else:
@@ -374,6 +480,7 @@ def submit_liked():
 
 
 @app.route('/get_liked_status/<int:item_id>', methods=['GET'])
+@conditional('user')
 def get_liked_status(item_id):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -419,6 +526,7 @@ def submit_watched():
 
         conn.commit()
         conn.close()
+        bump_generation('user')
 
         return jsonify({"message": "Watched status submitted successfully!"}), 200
     else:
@@ -426,6 +534,7 @@ def submit_watched():
     
 
 @app.route('/get_watched_status/<int:item_id>', methods=['GET'])
+@conditional('user')
 def get_watched_status(item_id):
     conn = get_db_connection()
     cursor = conn.cursor()
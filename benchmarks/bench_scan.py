@@ -0,0 +1,140 @@
+"""
+Times the scan and ingest path end to end on a synthetic library, offline.
+
+    python benchmarks/bench_scan.py                          # generate a library in a temp dir
+    python benchmarks/bench_scan.py --library D:/bench_lib   # reuse one from synthetic_library.py
+    python benchmarks/bench_scan.py --json baseline.json     # keep the numbers to compare later
+
+Runs in a scratch working directory with its own settings.json, library.db and the ffprobe / ffmpeg
+stubs (stub_ffmpeg.py). TMDB lookups are skipped unless --tmdb is given. Measured:
+    verify (cold)         -- verify_library_integrity with empty file / directory state
+    verify (warm)         -- the same scan again, served from file_state / dir_state
+    probe (cold)          -- the ingest pipeline's probe stage on every new file, one ffprobe each
+    probe (warm)          -- again, probes from the probe_cache table
+    library_manager       -- library_manager() until the ingest pipeline is drained, with files/s per stage
+Note transcode.py waits 1s per file that needs a transcode, keep --mkv-share low for ingest numbers.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import stub_ffmpeg
+import synthetic_library
+
+
+def timed(results, name, count, fn):
+    start_time = time.time()
+    value = fn()
+    duration = time.time() - start_time
+    rate = count / duration if duration else 0.0
+    results.append({'name': name, 'files': count, 'seconds': round(duration, 3), 'files_per_second': round(rate, 1)})
+    print(f'[ bench ] {name:<22} {count:>7} files  {duration:>9.3f}s  {rate:>10.1f} files/s')
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--library', help='existing synthetic library (with movies/ and series/)')
+    parser.add_argument('--workdir', help='scratch directory, a temp dir by default')
+    parser.add_argument('--movies', type=int, default=500)
+    parser.add_argument('--shows', type=int, default=20)
+    parser.add_argument('--seasons', type=int, default=3)
+    parser.add_argument('--episodes', type=int, default=10)
+    parser.add_argument('--mkv-share', type=float, default=0.02)
+    parser.add_argument('--skip-ingest', action='store_true', help='only time the scan and the probes')
+    parser.add_argument('--tmdb', action='store_true', help='do the real TMDB lookups during ingest')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--keep', action='store_true', help="don't delete the scratch directory")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='lms_bench_'))
+    os.makedirs(workdir, exist_ok=True)
+    library = os.path.abspath(args.library or os.path.join(workdir, 'library'))
+
+    if not args.library:
+        start_time = time.time()
+        written = synthetic_library.generate(library, args.movies, args.shows, args.seasons, args.episodes, args.mkv_share)
+        print(f"[ bench ] generated {len(written['movies'])} movies and {len(written['series'])} episodes "
+              f"in {time.time() - start_time:.1f}s")
+
+    os.chdir(workdir)
+    stub_ffmpeg.install(workdir)
+    with open('settings.json', 'w', encoding='utf-8') as f:
+        json.dump({'libraries': {'movies': [os.path.join(library, 'movies')],
+                                 'series': [os.path.join(library, 'series')]}}, f, indent=4)
+    if os.path.exists('library.db'):
+        os.remove('library.db')
+
+    # Imported only now, the modules resolve settings.json / library.db / the binaries from the cwd
+    from database_create import create_database
+    from library_manager import verify_library_integrity, library_manager
+    from probe_cache import probe_cache
+    from progress import progress
+    import ingest_pipeline
+
+    if not args.tmdb:
+        ingest_pipeline.tmdb_api = lambda file_hash_key: None
+
+    create_database()
+    results = []
+
+    total = sum(1 for _ in synthetic_library_files(library))
+    added, _, _ = timed(results, 'verify (cold)', total, lambda: verify_library_integrity('movies', 'series'))
+    timed(results, 'verify (warm)', total, lambda: verify_library_integrity('movies', 'series'))
+
+    def probe_all():
+        # Same work as the pipeline's probe stage, run inline so it can be timed on its own
+        for category, file, root in added:
+            ingest_pipeline.probe({'category': category, 'file': file, 'root': root, 'file_hash_key': None})
+
+    timed(results, 'probe (cold)', len(added), probe_all)
+    probe_cache.clear()
+    timed(results, 'probe (warm)', len(added), probe_all)
+
+    if not args.skip_ingest:
+        progress.reset()
+
+        def finished():
+            return sum(stage['done'] + stage['failed'] for stage in progress.snapshot() if stage['stage'] == 'ingest')
+
+        def ingest():
+            library_manager()
+            while finished() < len(added):
+                time.sleep(0.05)    # library_manager hands the files over from a background thread
+
+        timed(results, 'library_manager', len(added), ingest)
+
+        for stage in progress.snapshot():
+            busy = (stage['last_activity'] or 0) - (stage['first_activity'] or 0)
+            rate = stage['done'] / busy if busy > 0 else 0.0
+            results.append({'name': f"stage {stage['stage']}", 'files': stage['done'], 'failed': stage['failed'],
+                            'seconds': round(busy, 3), 'files_per_second': round(rate, 1)})
+            print(f"[ bench ]   stage {stage['stage']:<14} {stage['done']:>7} done {stage['failed']:>5} failed"
+                  f"  {busy:>9.3f}s  {rate:>10.1f} files/s")
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump({'library': library, 'results': results}, f, indent=4)
+
+    if not args.keep and not args.workdir:
+        os.chdir(BENCH_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def synthetic_library_files(library):
+    for root, _, files in os.walk(library):
+        for file in files:
+            yield os.path.join(root, file)
+
+
+if __name__ == '__main__':
+    main()
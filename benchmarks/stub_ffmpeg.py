@@ -0,0 +1,74 @@
+"""
+Stand-in for ffprobe.exe / ffmpeg.exe, so scans and ingest can be timed without real media or FFmpeg.
+
+install(directory) writes executable ffprobe.exe and ffmpeg.exe wrappers around this script into
+directory, which must be the working directory of the code under test (extract_metadata and
+transcode look for the binaries in os.getcwd()). The wrappers are POSIX scripts with a shebang;
+on Windows run the benchmarks under WSL.
+
+ffprobe -- prints canned JSON: .mp4 is h264 / aac, anything else HEVC / E-AC-3 with an English
+           subtitle stream, duration derived from the file size.
+ffmpeg  -- writes a small unique file to the output path (keyframe, subtitle or transcode output).
+
+BENCH_PROBE_DELAY_MS / BENCH_FFMPEG_DELAY_MS add a fixed delay to every call, to model real costs.
+"""
+import os
+import sys
+import json
+import time
+import stat
+
+
+def ffprobe(args):
+    path = args[-1]
+    size = os.path.getsize(path)
+    streamable = path.lower().endswith('.mp4')
+
+    streams = [
+        {'index': 0, 'codec_type': 'video', 'codec_name': 'h264' if streamable else 'hevc',
+         'width': 1920, 'height': 1080, 'avg_frame_rate': '24000/1001'},
+        {'index': 1, 'codec_type': 'audio', 'codec_name': 'aac' if streamable else 'eac3',
+         'channels': 2 if streamable else 6, 'tags': {'language': 'eng'}},
+    ]
+    if not streamable:
+        streams.append({'index': 2, 'codec_type': 'subtitle', 'codec_name': 'subrip',
+                        'tags': {'language': 'eng', 'title': 'English'}})
+
+    duration = max(size / (500 * 1024), 60.0)     # ~4 Mbit/s
+    print(json.dumps({
+        'streams': streams,
+        'format': {'filename': path, 'duration': f'{duration:.6f}', 'size': str(size),
+                   'bit_rate': str(int(size * 8 / duration)), 'tags': {}},
+    }))
+
+
+def ffmpeg(args):
+    output = args[-1]
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'wb') as f:
+        f.write(' '.join(args).encode('utf-8'))     # unique per input, so outputs get distinct fingerprints
+        f.write(os.urandom(16))
+
+
+def install(directory):
+    """Write ffprobe.exe / ffmpeg.exe wrappers into directory."""
+    for name in ('ffprobe.exe', 'ffmpeg.exe'):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as f:
+            f.write(f'#!{sys.executable}\n')
+            f.write('import sys\n')
+            f.write(f'sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})\n')
+            f.write('import stub_ffmpeg\n')
+            f.write(f'stub_ffmpeg.main({name.split(".")[0]!r}, sys.argv[1:])\n')
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def main(tool, args):
+    delay = os.environ.get('BENCH_PROBE_DELAY_MS' if tool == 'ffprobe' else 'BENCH_FFMPEG_DELAY_MS')
+    if delay:
+        time.sleep(int(delay) / 1000)
+    (ffprobe if tool == 'ffprobe' else ffmpeg)(args)
+
+
+if __name__ == '__main__':
+    main(os.path.basename(sys.argv[0]).split('.')[0], sys.argv[1:])
@@ -0,0 +1,99 @@
+"""
+Synthetic media library for the benchmarks.
+
+Writes thousands of sparse files named like real releases:
+    <root>/movies/<Title> (<year>)/<Title>.<year>.1080p.WEBRip.x264-GROUP.mp4
+    <root>/series/<Show>/Season 01/<Show>.S01E01.1080p.WEB.h264-GROUP.mkv
+
+Every file gets 64 KiB of random bytes at the head, middle and tail and is otherwise a hole, so files are
+cheap to create but each one has its own fingerprint. Files that end in .mkv are probed by the ffprobe
+stub as HEVC with an English subtitle stream, .mp4 files as h264 / aac (see stub_ffmpeg.py).
+
+    python benchmarks/synthetic_library.py D:/bench_lib --movies 2000 --shows 60 --seasons 4 --episodes 10
+"""
+import os
+import random
+import argparse
+
+
+WORDS = [
+    'Silent', 'River', 'Night', 'Empire', 'Last', 'Shadow', 'Crown', 'Winter', 'Broken', 'Signal',
+    'Iron', 'Garden', 'Lost', 'City', 'Northern', 'Light', 'Hollow', 'Storm', 'Paper', 'Machine',
+    'Golden', 'Harbor', 'Wild', 'Echo', 'Glass', 'Kingdom', 'Red', 'Station', 'Deep', 'Orbit',
+]
+GROUPS = ['GalaxyRG', 'NTb', 'FLUX', 'SPARKS', 'RARBG', 'EDITH']
+RESOLUTIONS = ['720p', '1080p', '2160p']
+SAMPLE = 64 * 1024      # bytes of real data written at each of head / middle / tail
+
+MB = 1024 * 1024
+
+
+def _title(rng, words):
+    return ' '.join(rng.sample(WORDS, words))
+
+
+def write_sparse(path, size, rng):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        for offset in (0, size // 2, max(size - SAMPLE, 0)):
+            f.seek(offset)
+            f.write(os.urandom(SAMPLE))
+        f.truncate(size)
+
+
+def generate(root, movies=1000, shows=40, seasons=3, episodes=10, mkv_share=0.25, size_scale=1.0, seed=1):
+    """Create the library under root; returns {'movies': [...], 'series': [...]} of the paths written."""
+    rng = random.Random(seed)
+    written = {'movies': [], 'series': []}
+
+    titles = set()
+    for _ in range(movies):
+        title = _title(rng, rng.randint(1, 3))
+        year = rng.randint(1970, 2025)
+        while (title, year) in titles:
+            year += 1
+        titles.add((title, year))
+
+        extension = 'mkv' if rng.random() < mkv_share else 'mp4'
+        name = f"{title.replace(' ', '.')}.{year}.{rng.choice(RESOLUTIONS)}.WEBRip.x264-{rng.choice(GROUPS)}.{extension}"
+        path = os.path.join(root, 'movies', f'{title} ({year})', name)
+        write_sparse(path, int(rng.randint(700, 4000) * MB * size_scale), rng)
+        written['movies'].append(path)
+
+    shows_done = set()
+    for _ in range(shows):
+        show = _title(rng, rng.randint(2, 3))
+        while show in shows_done:
+            show = _title(rng, 3)
+        shows_done.add(show)
+
+        extension = 'mkv' if rng.random() < mkv_share else 'mp4'
+        for season in range(1, seasons + 1):
+            for episode in range(1, episodes + 1):
+                name = f"{show.replace(' ', '.')}.S{season:02}E{episode:02}.1080p.WEB.h264-{rng.choice(GROUPS)}.{extension}"
+                path = os.path.join(root, 'series', show, f'Season {season:02}', name)
+                write_sparse(path, int(rng.randint(150, 900) * MB * size_scale), rng)
+                written['series'].append(path)
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root')
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=40)
+    parser.add_argument('--seasons', type=int, default=3)
+    parser.add_argument('--episodes', type=int, default=10)
+    parser.add_argument('--mkv-share', type=float, default=0.25, help='share of files that need a transcode')
+    parser.add_argument('--size-scale', type=float, default=1.0, help='scale the apparent file sizes')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    written = generate(args.root, args.movies, args.shows, args.seasons, args.episodes,
+                       args.mkv_share, args.size_scale, args.seed)
+    print(f"[ info ] {len(written['movies'])} movies and {len(written['series'])} episodes written to {args.root}")
+
+
+if __name__ == '__main__':
+    main()
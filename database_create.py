@@ -2,15 +2,14 @@
 import os
 import sqlite3
 
+from db_connect import DB_PATH, get_db_connection
 
 
 
 def create():
 
     # Connect to SQLite database (creates file if it doesn’t exist)
-    conn = sqlite3.connect("library.db")
-    # Enable foreign key support
-    conn.execute("PRAGMA foreign_keys = ON;")
+    conn = get_db_connection()
 
     cursor = conn.cursor()
 
@@ -249,6 +248,20 @@ def create():
 
 
 
+    create_media_counts(cursor)
+    create_search_index(cursor)
+    create_indexes(cursor)
+    
+
+
+
+
+
+    conn.commit()
+    conn.close()
+
+
+def create_indexes(cursor):
     # JINDEX
     
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_media_items_title ON media_items (title);')
@@ -259,19 +272,156 @@ def create():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_media_metadata_path ON media_metadata (path);')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_media_items_hashed_title ON media_items (title_hash_key);')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_media_metadata_hashed_file ON media_metadata (file_hash_key);')
-    
 
+    # Keyset pagination -- /movies, /series (title) and the per-category home rows (entry_updated)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_media_items_category_title ON media_items (category, title, id);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_media_items_category_updated ON media_items (category, entry_updated, id);')
 
 
+def create_media_counts(cursor):
+    # Row counts of media_items per category ('*' = all), read by the pagers instead of COUNT(*)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_counts (
+            category TEXT PRIMARY KEY,          -- media_items.category, '' for NULL, '*' for the whole library
+            total INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
 
+    # Triggers to keep media_counts exact
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS media_counts_after_insert
+        AFTER INSERT ON media_items
+        FOR EACH ROW
+        BEGIN
+            INSERT OR IGNORE INTO media_counts (category, total) VALUES ('*', 0), (COALESCE(NEW.category, ''), 0);
+            UPDATE media_counts SET total = total + 1 WHERE category IN ('*', COALESCE(NEW.category, ''));
+        END;
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS media_counts_after_delete
+        AFTER DELETE ON media_items
+        FOR EACH ROW
+        BEGIN
+            UPDATE media_counts SET total = total - 1 WHERE category IN ('*', COALESCE(OLD.category, ''));
+        END;
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS media_counts_after_category_update
+        AFTER UPDATE OF category ON media_items
+        FOR EACH ROW
+        WHEN COALESCE(OLD.category, '') != COALESCE(NEW.category, '')
+        BEGIN
+            INSERT OR IGNORE INTO media_counts (category, total) VALUES (COALESCE(NEW.category, ''), 0);
+            UPDATE media_counts SET total = total - 1 WHERE category = COALESCE(OLD.category, '');
+            UPDATE media_counts SET total = total + 1 WHERE category = COALESCE(NEW.category, '');
+        END;
+    ''')
 
-    conn.commit()
-    conn.close()
+
+def repair_media_counts(cursor):
+    """Recompute media_counts from media_items, e.g. after bulk operations or on databases created before the table existed."""
+    cursor.execute('DELETE FROM media_counts')
+    cursor.execute('''
+        INSERT INTO media_counts (category, total)
+        SELECT COALESCE(category, ''), COUNT(*) FROM media_items GROUP BY COALESCE(category, '')
+    ''')
+    cursor.execute("INSERT INTO media_counts (category, total) SELECT '*', COUNT(*) FROM media_items")
+
+
+SEARCH_COLUMNS_SQL = '''
+    COALESCE(mi.title, ''), COALESCE(mi.tagline, ''), COALESCE(mi.description, ''), COALESCE(mi.studio, ''),
+    COALESCE((SELECT group_concat(g.genre, ' ') FROM media_genres mg JOIN genres g ON mg.genre_id = g.id WHERE mg.media_item_id = mi.id), '')
+'''
+
+
+def create_search_index(cursor):
+    """
+    FTS5 index over media_items (rowid = media_items.id) used by MediaItem.search.
+    Prefers the trigram tokenizer (substring matches like the old LIKE '%query%'), falls back to word prefixes.
+    Returns True if the table had to be created, so callers know to backfill it.
+    """
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'media_search'").fetchone():
+        return False
+
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE media_search USING fts5(title, tagline, description, studio, genres, tokenize = 'trigram')")
+    except sqlite3.OperationalError:
+        try:
+            # sqlite older than 3.34 has no trigram tokenizer
+            cursor.execute("CREATE VIRTUAL TABLE media_search USING fts5(title, tagline, description, studio, genres, prefix = '2 3')")
+        except sqlite3.OperationalError as e:
+            print(f'[ warning ] FTS5 unavailable, search falls back to LIKE: {e}')
+            return False
+
+    # Triggers to keep media_search in sync
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS media_search_after_insert
+        AFTER INSERT ON media_items
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO media_search (rowid, title, tagline, description, studio, genres)
+            SELECT mi.id, {SEARCH_COLUMNS_SQL} FROM media_items mi WHERE mi.id = NEW.id;
+        END;
+    ''')
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS media_search_after_update
+        AFTER UPDATE OF title, tagline, description, studio ON media_items
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM media_search WHERE rowid = OLD.id;
+            INSERT INTO media_search (rowid, title, tagline, description, studio, genres)
+            SELECT mi.id, {SEARCH_COLUMNS_SQL} FROM media_items mi WHERE mi.id = NEW.id;
+        END;
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS media_search_after_delete
+        AFTER DELETE ON media_items
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM media_search WHERE rowid = OLD.id;
+        END;
+    ''')
+
+    for event, row in (('INSERT', 'NEW'), ('DELETE', 'OLD')):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS media_search_genres_after_{event.lower()}
+            AFTER {event} ON media_genres
+            FOR EACH ROW
+            BEGIN
+                UPDATE media_search
+                SET genres = COALESCE((
+                    SELECT group_concat(g.genre, ' ')
+                    FROM media_genres mg
+                    JOIN genres g ON mg.genre_id = g.id
+                    WHERE mg.media_item_id = {row}.media_item_id), '')
+                WHERE rowid = {row}.media_item_id;
+            END;
+        ''')
+
+    return True
+
+
+def rebuild_search_index(cursor):
+    """One-shot backfill of media_search from media_items."""
+    cursor.execute('DELETE FROM media_search')
+    cursor.execute(f'''
+        INSERT INTO media_search (rowid, title, tagline, description, studio, genres)
+        SELECT mi.id, {SEARCH_COLUMNS_SQL} FROM media_items mi
+    ''')
+    print('[ info ] Search index rebuilt.')
 
 
 def create_database():
-    if os.path.exists("library.db"):
+    if os.path.exists(DB_PATH):
         print(f'[ info ] Database found.')   
     else:
         print(f'[ info ] Creating new database...')
         create()
+
+    # Brings new and existing databases up to the latest schema version
+    from migrations import run_migrations
+    run_migrations()
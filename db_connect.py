@@ -1,6 +1,124 @@
 import sqlite3
+import threading
 
-def get_db_connection():
-    conn = sqlite3.connect('library.db')
-    conn.row_factory = sqlite3.Row  
+from flask import g, has_app_context
+
+
+DB_PATH = 'library.db'
+
+# Connection tuning applied to every new connection.
+# journal_mode=WAL lets readers (web threads) run while one writer (ingest, tmdb) commits.
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',      # safe with WAL, avoids an fsync per commit
+    'PRAGMA cache_size = -16000',       # ~16 MB page cache per connection
+    'PRAGMA mmap_size = 268435456',     # 256 MB memory mapped reads
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 5000',       # wait for locks instead of failing with "database is locked"
+)
+
+CACHED_STATEMENTS = 256     # prepared statements kept per connection
+MAX_IDLE_CONNECTIONS = 16   # waitress threads + watchdog workers + queue worker + spare
+
+
+def _open_connection(path):
+    conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
+
+
+class PooledConnection:
+    """Thin wrapper around sqlite3.Connection. close() hands the connection back to the pool instead of closing it."""
+
+    def __init__(self, pool, conn, request_scoped=False):
+        self._pool = pool
+        self._conn = conn
+        self._request_scoped = request_scoped
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        # Request scoped connections are released by the Flask teardown, not by the caller.
+        if self._request_scoped:
+            return
+        self.release()
+
+    def release(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool.release(conn)
+
+
+class ConnectionPool:
+    """Keeps tuned sqlite3 connections open and reuses them across threads."""
+
+    def __init__(self, path=DB_PATH, max_idle=MAX_IDLE_CONNECTIONS):
+        self.path = path
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self, request_scoped=False):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = _open_connection(self.path)
+        return PooledConnection(self, conn, request_scoped)
+
+    def release(self, conn):
+        # Match the old close() semantics: anything not committed is discarded.
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+pool = ConnectionPool()
+
+
+def get_db_connection():
+    """Return a pooled connection. Inside a Flask request the same connection is reused until teardown."""
+    if has_app_context():
+        conn = g.get('db_conn')
+        if conn is None:
+            conn = g.db_conn = pool.acquire(request_scoped=True)
+        return conn
+    return pool.acquire()
+
+
+def release_request_connection(exception=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.release()
+
+
+def init_app(app):
+    """Register request-scoped connection cleanup with the Flask app."""
+    app.teardown_appcontext(release_request_connection)
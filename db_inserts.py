@@ -2,46 +2,55 @@ import json
 import sqlite3
 from datetime import datetime
 from db_connect import get_db_connection
-
-def insert_to_media_items_table(cursor, item):
-    cursor.execute(''' 
-        INSERT OR IGNORE INTO media_items (
-            category,
-            title,
-            release_date,
-            title_hash_key
-        )
-        VALUES (?, ?, ?, ?)
-    ''', (
+from library_state import bump_generation
+from fingerprint_index import fingerprints
+from database_create import repair_media_counts
+
+MEDIA_ITEMS_INSERT = '''
+    INSERT OR IGNORE INTO media_items (
+        category,
+        title,
+        release_date,
+        title_hash_key
+    )
+    VALUES (?, ?, ?, ?)
+'''
+
+MEDIA_METADATA_INSERT = '''
+    INSERT OR IGNORE INTO media_metadata (
+        media_item_id,
+        season,
+        episode,
+        resolution, 
+        extension, 
+        path, 
+        file_size,
+        duration,
+        audio_codec,
+        video_codec,
+        bitrate,
+        frame_rate,
+        width,
+        height,
+        aspect_ratio,    
+        file_hash_key,
+        key_frame
+    ) 
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def media_item_row(item):
+    return (
         item.get('category', None),
         item.get('title', None),
         item.get('release_date', None),
         item.get('title_hash_key', None)
-    ))
+    )
 
 
-def insert_to_media_metadata_table(cursor, item, media_item_id):
-    cursor.execute('''
-        INSERT OR IGNORE INTO media_metadata (
-            media_item_id,
-            season,
-            episode,
-            resolution, 
-            extension, 
-            path, 
-            file_size,
-            duration,
-            audio_codec,
-            video_codec,
-            bitrate,
-            frame_rate,
-            width,
-            height,
-            aspect_ratio,    
-            file_hash_key,
-            key_frame
-        ) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (
+def media_metadata_row(item, media_item_id):
+    return (
         media_item_id, 
         item.get('season', None),
         item.get('episode', None),
@@ -59,7 +68,15 @@ def insert_to_media_metadata_table(cursor, item, media_item_id):
         item.get('aspect_ratio', None),
         item.get('file_hash_key', None),
         item.get('key_frame', None)
-    ))
+    )
+
+
+def insert_to_media_items_table(cursor, item):
+    cursor.execute(MEDIA_ITEMS_INSERT, media_item_row(item))
+
+
+def insert_to_media_metadata_table(cursor, item, media_item_id):
+    cursor.execute(MEDIA_METADATA_INSERT, media_metadata_row(item, media_item_id))
 
 def insert_to_tv_seasons_table(cursor, item, media_item_id):
     cursor.execute('''
@@ -235,66 +252,141 @@ def api_insert_metadata_to_database(cursor, item_data, item_id, category, year):
                 print(f"[ tmdb.api warning ] Genre '{genre_name}' not found in database.")
 
 
-def insert_movie(movie):
+def insert_entries(entries):
+    """
+    Write parsed entries (get_movie_metadata / get_series_metadata output) in one transaction.
+    Entries whose file_hash_key is already in the library are skipped. Returns the file_hash_keys inserted.
+    """
+    entries = list({entry['file_hash_key']: entry for entry in entries}.values())
+    if not entries:
+        return []
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    existing_item = cursor.execute("SELECT media_item_id FROM media_metadata WHERE file_hash_key = ?", (movie["file_hash_key"],)).fetchone()
-    if existing_item:
-        return
-
-    existing_item = cursor.execute("SELECT id FROM media_items WHERE title_hash_key = ?", (movie["title_hash_key"],)).fetchone()
-    if not existing_item:
-        insert_to_media_items_table(cursor, movie)
-        existing_item = cursor.lastrowid
-    else:
-        existing_item = existing_item[0]
-
-    
-    insert_to_media_metadata_table(cursor, movie, existing_item)
-
-    metadata_table_id = cursor.lastrowid
-    insert_to_subtitles_table(cursor, movie, metadata_table_id)
-
-    conn.commit()
-    conn.close() 
-
-
+    try:
+        known = {row[0] for row in cursor.execute(
+            "SELECT file_hash_key FROM media_metadata WHERE file_hash_key IN (SELECT value FROM json_each(?))",
+            (json.dumps([entry['file_hash_key'] for entry in entries]),))}
+        entries = [entry for entry in entries if entry['file_hash_key'] not in known]
+        if not entries:
+            return []
+
+        # media_items -- insert the missing titles, then resolve every title_hash_key -> id at once
+        cursor.executemany(MEDIA_ITEMS_INSERT, [media_item_row(entry) for entry in entries])
+        item_ids = dict(cursor.execute(
+            "SELECT title_hash_key, id FROM media_items WHERE title_hash_key IN (SELECT value FROM json_each(?))",
+            (json.dumps(list({entry['title_hash_key'] for entry in entries})),)).fetchall())
+
+        cursor.executemany(MEDIA_METADATA_INSERT, [media_metadata_row(entry, item_ids[entry['title_hash_key']]) for entry in entries])
+        metadata_ids = dict(cursor.execute(
+            "SELECT file_hash_key, id FROM media_metadata WHERE file_hash_key IN (SELECT value FROM json_each(?))",
+            (json.dumps([entry['file_hash_key'] for entry in entries]),)).fetchall())
+
+        # A row ignored by INSERT OR IGNORE (e.g. its path is taken) has no id and gets no subtitles
+        cursor.executemany("INSERT OR IGNORE INTO media_subtitles (media_metadata_id, subtitle_path) VALUES (?, ?)", [
+            (metadata_ids[entry['file_hash_key']], str(subtitle))
+            for entry in entries if entry['file_hash_key'] in metadata_ids
+            for subtitle in entry.get('subtitles') or []
+        ])
+
+        # Seasons and episodes set-wise, the unique indexes on both tables make re-inserts no-ops
+        episodes = [entry for entry in entries if entry.get('category') == 'series']
+        cursor.executemany("INSERT OR IGNORE INTO tv_seasons (media_item_id, season) VALUES (?, ?)", list(
+            {(item_ids[entry['title_hash_key']], entry.get('season')) for entry in episodes}))
+        cursor.executemany("INSERT OR IGNORE INTO tv_episodes (media_item_id, season, episode) VALUES (?, ?, ?)", list(
+            {(item_ids[entry['title_hash_key']], entry.get('season'), entry.get('episode')) for entry in episodes}))
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    # A row ignored by INSERT OR IGNORE (e.g. its path is taken) wasn't inserted
+    inserted = [entry for entry in entries if entry['file_hash_key'] in metadata_ids]
+    fingerprints.add({entry['file_hash_key']: entry['path'] for entry in inserted})
+    bump_generation()
+    return [entry['file_hash_key'] for entry in inserted]
+
+
+def _delete_keys(cursor, keys):
+    # keys -- JSON list of file_hash_key; returns the number of media_metadata rows deleted
+    cursor.execute('''
+        DELETE FROM media_subtitles WHERE media_metadata_id IN (
+            SELECT id FROM media_metadata WHERE file_hash_key IN (SELECT value FROM json_each(?)))
+    ''', (keys,))
+    cursor.execute("DELETE FROM media_metadata WHERE file_hash_key IN (SELECT value FROM json_each(?))", (keys,))
+    removed = cursor.rowcount
+    cursor.execute("DELETE FROM probe_cache WHERE file_hash_key IN (SELECT value FROM json_each(?))", (keys,))
+    return removed
+
+
+def delete_entries(file_hash_keys, repair_counts=False):
+    """
+    Remove files from the library by file_hash_key in one transaction -- their media_metadata rows,
+    subtitles and cached probes. Returns the number of media_metadata rows deleted.
+    repair_counts -- recount media_counts afterwards, for bulk removals (the triggers keep it right otherwise)
+    """
+    file_hash_keys = list(file_hash_keys)
 
-def insert_tv_series(serie):
-    # serie input: [{'title': 'Gen V', 'season': 1, 'episode': 1, 'path': 'D:/Lib/series/Gen V/Season 01/gen v s01e01.mkv', ...}]
     conn = get_db_connection()
-    cursor = conn.cursor()    
-    existing_item = cursor.execute("SELECT media_item_id FROM media_metadata WHERE file_hash_key = ?", (serie["file_hash_key"],)).fetchone()
-    if existing_item:
-        return
-    
-
-
-
-    existing_item = cursor.execute("SELECT id FROM media_items WHERE title_hash_key = ?", (serie["title_hash_key"],)).fetchone()
-    if not existing_item:
-        insert_to_media_items_table(cursor, serie)
-        existing_item = cursor.lastrowid
-    else:
-        existing_item = existing_item[0]
-
-        
-    insert_to_media_metadata_table(cursor, serie, existing_item)
-
-
-    metadata_table_id = cursor.lastrowid
-    insert_to_subtitles_table(cursor, serie, metadata_table_id)
+    cursor = conn.cursor()
+    try:
+        removed = _delete_keys(cursor, json.dumps(file_hash_keys))
+        if repair_counts:
+            repair_media_counts(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    fingerprints.discard(file_hash_keys)
+    bump_generation()
+    return removed
+
+
+def delete_paths(paths):
+    """
+    Remove whatever the library has at these paths, or below them when a path is a directory,
+    in one transaction. Paths are matched against media_metadata.path, nothing is re-scanned.
+    Returns the number of media_metadata rows deleted.
+    """
+    # Stored paths use forward slashes (see extract_metadata.get_path)
+    paths = json.dumps([path.replace("\\", "/").rstrip("/") for path in paths])
 
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        file_hash_keys = [row[0] for row in cursor.execute('''
+            SELECT DISTINCT m.file_hash_key FROM media_metadata m
+            JOIN json_each(?) p ON m.path = p.value OR substr(m.path, 1, length(p.value) + 1) = p.value || '/'
+        ''', (paths,))]
+        removed = _delete_keys(cursor, json.dumps(file_hash_keys))
+        cursor.execute('''
+            DELETE FROM file_state WHERE EXISTS (
+                SELECT 1 FROM json_each(?) p
+                WHERE file_state.path = p.value OR substr(file_state.path, 1, length(p.value) + 1) = p.value || '/')
+        ''', (paths,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    fingerprints.discard(file_hash_keys)
+    if removed:
+        bump_generation()
+    return removed
 
-    existing_season = cursor.execute("SELECT id FROM tv_seasons WHERE media_item_id = ? AND season = ?", (existing_item, serie["season"])).fetchone()
-    if not existing_season:
-        insert_to_tv_seasons_table(cursor, serie, existing_item)   
-    
 
+def insert_movie(movie):
+    insert_entries([movie])
 
-    existing_episode = cursor.execute("SELECT id FROM tv_episodes WHERE media_item_id = ? AND season = ? AND episode = ?", (existing_item, serie["season"], serie["episode"])).fetchone()
-    if not existing_episode:
-        insert_to_tv_episodes_table(cursor, serie, existing_item)
 
-    conn.commit()
-    conn.close()
\ No newline at end of file
+def insert_tv_series(serie):
+    # serie input: {'title': 'Gen V', 'season': 1, 'episode': 1, 'path': 'D:/Lib/series/Gen V/Season 01/gen v s01e01.mkv', ...}
+    insert_entries([serie])
@@ -4,8 +4,17 @@ import time
 import hashlib
 import subprocess
 import json
+import threading
 from datetime import datetime
 
+from probe_cache import probe_cache
+
+
+# One read buffer per thread, reused by every get_file_hash() call on that thread
+_read_buffers = threading.local()
+
+KEYFRAME_FOLDER = "static/images/keyFrames/"
+
 def time_to_seconds(time_str):
     hours, minutes, seconds = map(int, time_str.split(':'))
     return hours * 3600 + minutes * 60 + seconds
@@ -14,7 +23,7 @@ def ffmpeg_key_frame(file, root, hash_key, duration):
     ffmpeg_path = os.path.join(os.getcwd(), 'ffmpeg.exe') 
     video_path = os.path.join(root, file).replace("\\", "/")
 
-    SAVE_FOLDER = "static/images/keyFrames/"
+    SAVE_FOLDER = KEYFRAME_FOLDER
     output_name = f'keyframe_{hash_key}.jpg'
     output_path = os.path.join(SAVE_FOLDER, output_name)
 
@@ -61,15 +70,15 @@ def ffmpeg_key_frame(file, root, hash_key, duration):
     else:
         return None    
 
-def get_movie_metadata(file, root):
+def get_movie_metadata(file, root, file_hash_key=None):
     # file output: Example.Media.2024.1080p.WEBRip.1400MB.DD5.1.x264-GalaxyRG.mp4
     # root output: D:/Lib/movies\Example Media\
     # media_file_path output: D:/Lib/movies/Example Media/Example.Media.2024.1080p.WEBRip.1400MB.DD5.1.x264-GalaxyRG.mp4 
 
-    ffprobe_metadata = get_video_metadata(file, root)
-    results = ffmpeg_video_metadata(ffprobe_metadata)
+    file_hash_key = file_hash_key or get_file_hash(file, root)
 
-    file_hash_key = get_file_hash(file, root)
+    ffprobe_metadata = get_video_metadata(file, root, file_hash_key)
+    results = ffmpeg_video_metadata(ffprobe_metadata)
 
     movie_entry = []
     # Now create the movie_entry dictionary with the added metadata
@@ -99,13 +108,15 @@ def get_movie_metadata(file, root):
     return movie_entry
 
 
-def get_series_metadata(file, root):
+def get_series_metadata(file, root, file_hash_key=None):
     # file output: Example.SERIES.2024.S1E02.1080p.WEBRip.1400MB.DD5.1.x264-GalaxyRG.mp4
     # root output: D:/Lib/movies\Example Media\
     # media_file_path output: D:/Lib/series/Example Media/Example.SERIES.2024.S1E02.1080p.WEBRip.1400MB.DD5.1.x264-GalaxyRG.mp4
     media_file_root_path = os.path.join(root, file).replace("\\", "/") 
     
-    ffprobe_metadata = get_video_metadata(file, root)
+    file_hash_key = file_hash_key or get_file_hash(file, root)
+
+    ffprobe_metadata = get_video_metadata(file, root, file_hash_key)
     results = ffmpeg_video_metadata(ffprobe_metadata)
 
 
@@ -118,10 +129,6 @@ def get_series_metadata(file, root):
     episode = get_series_episode(file)
 
 
-
-
-    file_hash_key = get_file_hash(file, root)
-
     # Find or create the series entry
     series_entry = next((s for s in series_metadata if s["title"] == series_title), None)
 
@@ -319,20 +326,71 @@ def get_size(file, root):
     return None
 
 
-def get_file_hash(file, root, portion_size=2 * 1024 * 1024):
-    full_path = os.path.join(root, file).replace("\\", "/") 
+# file_hash_key scheme. Keys are prefixed with their version so an old key is never mistaken for a new one.
+#   1 (no prefix) -- MD5 of the first 2 MB, see legacy_file_hash()
+#   2             -- blake2b over the file size and a few sampled windows, see get_file_hash()
+FINGERPRINT_VERSION = 2
+FINGERPRINT_WINDOW = 64 * 1024
+FINGERPRINT_SAMPLES = (0.0, 0.25, 0.5, 0.75, 1.0)     # window positions, as a fraction of the file size
+
+
+def _read_buffer(size):
+    buffer = getattr(_read_buffers, 'buffer', None)
+    if buffer is None or len(buffer) < size:
+        buffer = _read_buffers.buffer = bytearray(size)
+    return memoryview(buffer)
+
+
+def _read_window(f, view, offset, size):
+    """Fill view[:size] from offset, returns the number of bytes read."""
+    f.seek(offset)
+    filled = 0
+    while filled < size:
+        read = f.readinto(view[filled:size])
+        if not read:
+            break
+        filled += read
+    return filled
+
+
+def get_file_hash(file, root):
     """
-    Returns the MD5 hash of a file based on its file title, path, and a portion of its contents.
+    Returns the content fingerprint (file_hash_key) of a file.
 
-    :param portion_size: The amount of the file to hash
-    :return: MD5 hash of the file and portion of the contents
+    blake2b over the file size plus FINGERPRINT_WINDOW bytes at each of FINGERPRINT_SAMPLES, so files
+    sharing a header (same intro, remuxes of one source) still differ by size, middle or tail.
+    Small files are hashed whole.
     """
-    hash_func = hashlib.md5()
-    #hash_func.update(path.encode('utf-8'))
+    full_path = os.path.join(root, file).replace("\\", "/") 
+
+    hash_func = hashlib.blake2b(digest_size=16, person=b'lms-file-v%d' % FINGERPRINT_VERSION)
+    view = _read_buffer(FINGERPRINT_WINDOW)
+
+    with open(full_path, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        hash_func.update(size.to_bytes(8, 'little'))
+
+        if size <= FINGERPRINT_WINDOW * len(FINGERPRINT_SAMPLES):
+            offsets = range(0, size, FINGERPRINT_WINDOW)
+        else:
+            offsets = [int((size - FINGERPRINT_WINDOW) * sample) for sample in FINGERPRINT_SAMPLES]
+
+        for offset in offsets:
+            filled = _read_window(f, view, offset, FINGERPRINT_WINDOW)
+            hash_func.update(view[:filled])
 
-    with open(full_path, 'rb') as f:
-        chunk = f.read(portion_size)
-        hash_func.update(chunk)
+    return f'v{FINGERPRINT_VERSION}_{hash_func.hexdigest()}'
+
+
+def legacy_file_hash(file, root, portion_size=2 * 1024 * 1024):
+    """Version 1 file_hash_key: MD5 of the first portion_size bytes. Only used to re-key old databases."""
+    full_path = os.path.join(root, file).replace("\\", "/") 
+
+    hash_func = hashlib.md5()
+    view = _read_buffer(portion_size)
+    with open(full_path, 'rb', buffering=0) as f:
+        filled = _read_window(f, view, 0, portion_size)
+    hash_func.update(view[:filled])
 
     return hash_func.hexdigest()
 
@@ -416,39 +474,21 @@ def process_subtitle_file(file, root, extension):
 
 def extract_subtitles(file, root):
     # Create an output directory based on the video file name
-    ffprobe_path = os.path.join(os.getcwd(), 'ffprobe.exe')
     ffmpeg_path = os.path.join(os.getcwd(), 'ffmpeg.exe')
     video_file = os.path.join(root, file).replace("\\", "/")
 
-    if not os.path.exists(ffprobe_path):
-        raise FileNotFoundError("ffprobe binary not found. Please ensure ffprobe is bundled with the application.")
-
     if not os.path.exists(ffmpeg_path):
         raise FileNotFoundError("ffmpeg binary not found. Please ensure ffmpeg is bundled with the application.")
     
     start_time = time.time()
     
-    # Get subtitle streams info using ffprobe
-    probe_cmd = [
-        ffprobe_path,
-        '-v', 'error',
-        '-select_streams', 's', 
-        '-show_entries', 'stream=index:stream_tags=title,language', 
-        '-of', 'json',
-        video_file
-    ]
-    
-    result = subprocess.run(
-        probe_cmd, 
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, 
-        encoding='utf-8', errors='replace')
-
-    # Parse the ffprobe output and extract subtitle streams
+    # Subtitle streams from the file's probe (shared with the metadata extraction)
     try:
-        subtitles = json.loads(result.stdout).get("streams", [])
+        streams = get_video_metadata(file, root).get("streams", [])
     except json.JSONDecodeError as e:
         print("[ warning ] Error parsing FFprobe output:", e)
         return []
+    subtitles = [stream for stream in streams if stream.get("codec_type") == "subtitle"]
 
     extracted_files = []
     
@@ -590,34 +630,42 @@ def frame_rate_to_float(frame_rate):
 
 
 
-def get_video_metadata(file, root):
+def run_ffprobe(video_path):
+    """One ffprobe over everything -- all streams, the format and their tags."""
     ffprobe_path = os.path.join(os.getcwd(), 'ffprobe.exe') 
-    video_path = os.path.join(root, file).replace("\\", "/")
-
 
     # Check if ffprobe binary exists
     if not os.path.exists(ffprobe_path):
         raise FileNotFoundError("ffprobe binary not found. Please ensure ffprobe is bundled with the application.")
-    
-
 
     cmd = [
         ffprobe_path,
         '-v', 'error', 
-        '-show_entries', 'format=duration,bit_rate', 
-        '-show_entries', 'stream=codec_name,width,height,avg_frame_rate,codec_type', 
+        '-show_format',
+        '-show_streams',
         '-of', 'json', 
         video_path
     ]
 
-
-    
     result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    metadata = json.loads(result.stdout.decode('utf-8'))
+    metadata = json.loads(result.stdout.decode('utf-8', errors='replace'))
     
     return metadata
 
 
+def get_video_metadata(file, root, file_hash_key=None):
+    """ffprobe JSON of a file, probed once and served from probe_cache afterwards."""
+    video_path = os.path.join(root, file).replace("\\", "/")
+    stat_result = os.stat(video_path)
+
+    return probe_cache.get_or_probe(
+        video_path,
+        (stat_result.st_size, stat_result.st_mtime_ns),
+        lambda: file_hash_key or get_file_hash(file, root),
+        lambda: run_ffprobe(video_path)
+    )
+
+
 
 def ffmpeg_video_metadata(metadata):
     # Extract general metadata
@@ -0,0 +1,145 @@
+import os
+import time
+import heapq
+import threading
+
+from directory_manager import load_paths
+
+
+# A new file is handed on only once it has stopped changing: same size and mtime for QUIET_SECONDS,
+# and it can be opened for reading (Windows keeps files being copied locked).
+# Checks start every MIN_INTERVAL seconds and back off up to MAX_INTERVAL while the file keeps
+# growing, so a long download costs a stat every now and then, not a busy loop.
+# Files still changing after TIMEOUT seconds are dropped (the next scan picks them up).
+# Override globally or per library root in settings.json, e.g. for slow network mounts:
+#     "file_stability": {"quiet_seconds": 5, "roots": {"//nas/movies": {"quiet_seconds": 30, "max_interval": 60}}}
+QUIET_SECONDS = 5
+MIN_INTERVAL = 0.5
+MAX_INTERVAL = 30
+TIMEOUT = 6 * 60 * 60
+
+DEFAULTS = {'quiet_seconds': QUIET_SECONDS, 'min_interval': MIN_INTERVAL, 'max_interval': MAX_INTERVAL, 'timeout': TIMEOUT}
+
+
+def file_signature(path):
+    """(size, mtime_ns) if the file exists and can be opened for reading, else None."""
+    try:
+        stat_result = os.stat(path)
+        with open(path, 'rb'):
+            pass
+    except OSError:
+        return None
+    return stat_result.st_size, stat_result.st_mtime_ns
+
+
+class PendingFile:
+    def __init__(self, path, callback, settings, now):
+        self.path = path
+        self.callback = callback
+        self.settings = settings
+        self.signature = None
+        self.changed_at = now
+        self.started_at = now
+        self.interval = settings['min_interval']
+
+
+class StabilityDetector:
+    """
+    Holds incoming files until they are quiescent, then calls their callback.
+    One background thread polls every pending file on its own backoff schedule.
+    """
+
+    def __init__(self, settings=None, root_settings=None):
+        self.settings = {**DEFAULTS, **(settings or {})}
+        self.root_settings = {os.path.normcase(os.path.normpath(root)): {**self.settings, **overrides}
+                              for root, overrides in (root_settings or {}).items()}
+        self._pending = {}      # path: PendingFile
+        self._schedule = []     # heap of (due_at, path)
+        self._wakeup = threading.Condition()
+        self._thread = None
+
+    @classmethod
+    def from_settings(cls, PATH=None):
+        if PATH is None:
+            try:
+                PATH = load_paths() or {}
+            except OSError:
+                PATH = {}
+        settings = dict(PATH.get('file_stability', {}))
+        roots = settings.pop('roots', {})
+        return cls(settings, roots)
+
+    def settings_for(self, path):
+        """Settings of the deepest configured root containing path."""
+        path = os.path.normcase(os.path.normpath(path))
+        best = None
+        for root in self.root_settings:
+            if (path == root or path.startswith(root.rstrip(os.sep) + os.sep)) and (best is None or len(root) > len(best)):
+                best = root
+        return self.root_settings[best] if best else self.settings
+
+    def watch(self, path, callback):
+        """Call callback(path) once the file stops changing. A path already being watched keeps its first callback."""
+        now = time.time()
+        with self._wakeup:
+            if path in self._pending:
+                return
+            pending = self._pending[path] = PendingFile(path, callback, self.settings_for(path), now)
+            heapq.heappush(self._schedule, (now + pending.interval, path))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='file-stability', daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+
+    def pending(self):
+        with self._wakeup:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._schedule or self._schedule[0][0] > time.time():
+                    self._wakeup.wait(self._schedule[0][0] - time.time() if self._schedule else None)
+                _, path = heapq.heappop(self._schedule)
+                pending = self._pending.get(path)
+            if pending is None:
+                continue
+
+            ready = self._check(pending, time.time())
+            with self._wakeup:
+                if ready is None:
+                    heapq.heappush(self._schedule, (time.time() + pending.interval, path))
+                    continue
+                del self._pending[path]
+
+            if ready:
+                try:
+                    pending.callback(path)
+                except Exception as e:
+                    print(f'[ warning ] {path} -- handling the finished file failed: {e}')
+
+    def _check(self, pending, now):
+        """True when the file is quiescent, False when it's given up on, None to check again later."""
+        settings = pending.settings
+        signature = file_signature(pending.path)
+
+        if signature is None and not os.path.exists(pending.path):
+            print(f'[ debug ] {pending.path} -- gone before it finished writing')
+            return False
+
+        if signature is None or signature != pending.signature:
+            # Still being written (or locked) -- back off while it keeps changing
+            pending.signature = signature
+            pending.changed_at = now
+            pending.interval = min(pending.interval * 2, settings['max_interval'])
+        elif now - pending.changed_at >= settings['quiet_seconds']:
+            print(f'[ debug ] {pending.path} -- stable after {now - pending.started_at:.1f}s')
+            return True
+        else:
+            # Unchanged, check again right when the quiet period would be over
+            pending.interval = max(settings['min_interval'], settings['quiet_seconds'] - (now - pending.changed_at))
+
+        if now - pending.started_at >= settings['timeout']:
+            print(f'[ warning ] {pending.path} -- still changing after {settings["timeout"]}s, skipped')
+            return False
+        return None
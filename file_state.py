@@ -0,0 +1,180 @@
+import os
+import json
+import time
+
+from db_connect import get_db_connection
+from extract_metadata import get_file_hash, get_path
+from progress import progress
+
+
+def stat_signature(stat_result):
+    """(size, mtime_ns, inode, device) -- if none of these changed the file content is assumed unchanged."""
+    return (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, stat_result.st_dev)
+
+
+class FileStateIndex:
+    """
+    Persisted path -> (stat signature, file_hash_key) map (table file_state).
+    Lets a startup scan reuse the stored hash of every file whose stat signature didn't change
+    instead of reading it again.
+    """
+
+    def __init__(self, states=None):
+        self.states = states or {}      # path: (size, mtime_ns, inode, device, file_hash_key)
+        self.changed = {}
+        self.seen = set()
+
+    @classmethod
+    def load(cls):
+        conn = get_db_connection()
+        rows = conn.execute('SELECT path, size, mtime_ns, inode, device, file_hash_key FROM file_state').fetchall()
+        conn.close()
+        return cls({row[0]: tuple(row[1:]) for row in rows})
+
+    def lookup(self, path, signature):
+        self.seen.add(path)
+        state = self.states.get(path)
+        if state is not None and state[:4] == signature:
+            return state[4]
+        return None
+
+    def record(self, path, signature, file_hash_key):
+        self.seen.add(path)
+        self.states[path] = (*signature, file_hash_key)
+        self.changed[path] = self.states[path]
+
+    def file_hash(self, file, root, stat_result=None):
+        """get_file_hash(), served from the index when the file's stat signature is unchanged."""
+        path = get_path(file, root)
+        signature = stat_signature(stat_result or os.stat(path))
+
+        file_hash_key = self.lookup(path, signature)
+        if file_hash_key is None:
+            file_hash_key = get_file_hash(file, root)
+            self.record(path, signature, file_hash_key)
+        return file_hash_key
+
+    def cached(self, path, stat_result):
+        """HashingService.hash_files() hook -- the stored hash if the file is unchanged."""
+        return self.lookup(path, stat_signature(stat_result))
+
+    def hash_entries(self, entries, service, stage=None):
+        """
+        Yields (category, file, root, file_hash_key) for a stream of (category, file, root).
+        Unchanged files come straight from the index, the rest are hashed in parallel on the service's
+        device pools and recorded. Files that can't be read are yielded with file_hash_key None and
+        keep their stored state, so the next scan tries them again.
+        stage -- optional progress stage, files are reported queued when found and done when hashed
+        """
+        def discovered():
+            # The walk is lazy, so the stage's total grows as files are found
+            for category, file, root in entries:
+                if stage:
+                    progress.queued(stage)
+                yield file, root, category
+
+        for result in service.hash_files(discovered(), cached=self.cached):
+            if stage:
+                progress.started(stage)
+                progress.finished(stage, failed=result.error is not None)
+            if result.error is not None:
+                print(f'[ warning ] Could not hash "{get_path(result.file, result.root)}": {result.error}')
+                yield result.tag, result.file, result.root, None
+                continue
+            if not result.cached:
+                self.record(get_path(result.file, result.root), stat_signature(result.stat_result), result.file_hash_key)
+            yield result.tag, result.file, result.root, result.file_hash_key
+
+    def save(self, prune=False):
+        """Write changed entries back; with prune=True also forget paths not seen since load()."""
+        stale = [path for path in self.states if path not in self.seen] if prune else []
+        if not self.changed and not stale:
+            return
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO file_state (path, size, mtime_ns, inode, device, file_hash_key, checked_at)
+            VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+            ON CONFLICT (path) DO UPDATE SET
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                inode = excluded.inode,
+                device = excluded.device,
+                file_hash_key = excluded.file_hash_key,
+                checked_at = excluded.checked_at
+        ''', [(path, *state) for path, state in self.changed.items()])
+        cursor.executemany('DELETE FROM file_state WHERE path = ?', [(path,) for path in stale])
+        conn.commit()
+        conn.close()
+
+        for path in stale:
+            del self.states[path]
+        self.changed = {}
+
+
+
+# A directory listed less than this long after its last change isn't remembered -- on coarse mtime
+# filesystems (SMB, FAT) a file added in the same tick wouldn't move the mtime
+DIR_MTIME_SLACK_NS = 2 * 10**9
+
+
+class DirectoryIndex:
+    """
+    Persisted directory -> (mtime_ns, video files, subdirectories) map (table dir_state).
+    A directory's mtime only changes when entries are added, removed or renamed directly in it, so while
+    it matches the stored one the walker reuses the stored listing instead of enumerating the directory.
+    """
+
+    def __init__(self, states=None):
+        self.states = states or {}      # path: (mtime_ns, files, subdirs)
+        self.changed = {}
+        self.seen = set()
+
+    @classmethod
+    def load(cls):
+        conn = get_db_connection()
+        rows = conn.execute('SELECT path, mtime_ns, files, subdirs FROM dir_state').fetchall()
+        conn.close()
+        return cls({row[0]: (row[1], json.loads(row[2]), json.loads(row[3])) for row in rows})
+
+    def lookup(self, path, mtime_ns):
+        """(files, subdirs) if the directory is unchanged since it was last listed, else None."""
+        self.seen.add(path)
+        state = self.states.get(path)
+        if state is not None and state[0] == mtime_ns:
+            return state[1], state[2]
+        return None
+
+    def record(self, path, mtime_ns, files, subdirs):
+        self.seen.add(path)
+        if time.time_ns() - mtime_ns < DIR_MTIME_SLACK_NS:
+            return
+        self.states[path] = (mtime_ns, files, subdirs)
+        self.changed[path] = self.states[path]
+
+    def save(self, prune=False):
+        """Write changed entries back; with prune=True also forget directories not seen since load()."""
+        stale = [path for path in self.states if path not in self.seen] if prune else []
+        if not self.changed and not stale:
+            return
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO dir_state (path, mtime_ns, files, subdirs, checked_at)
+            VALUES (?, ?, ?, ?, datetime('now'))
+            ON CONFLICT (path) DO UPDATE SET
+                mtime_ns = excluded.mtime_ns,
+                files = excluded.files,
+                subdirs = excluded.subdirs,
+                checked_at = excluded.checked_at
+        ''', [(path, mtime_ns, json.dumps(files), json.dumps(subdirs))
+              for path, (mtime_ns, files, subdirs) in self.changed.items()])
+        cursor.executemany('DELETE FROM dir_state WHERE path = ?', [(path,) for path in stale])
+        conn.commit()
+        conn.close()
+
+        for path in stale:
+            del self.states[path]
+        self.changed = {}
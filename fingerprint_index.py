@@ -0,0 +1,62 @@
+import threading
+
+from db_connect import get_db_connection
+
+
+class FingerprintIndex:
+    """
+    Process-wide file_hash_key -> path map of everything in media_metadata.
+    Read from the database once, on first use, then kept current by db_inserts (inserts, deletes)
+    and library_manager.apply_moves. The watcher's duplicate check and the startup reconciliation
+    query it instead of reading the whole table.
+    """
+
+    def __init__(self):
+        self._paths = None
+        self._lock = threading.Lock()
+
+    def _loaded(self):
+        # Call with the lock held
+        if self._paths is None:
+            conn = get_db_connection()
+            rows = conn.execute('SELECT file_hash_key, path FROM media_metadata').fetchall()
+            conn.close()
+            self._paths = {row[0]: row[1] for row in rows}
+        return self._paths
+
+    def __contains__(self, file_hash_key):
+        with self._lock:
+            return file_hash_key in self._loaded()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._loaded())
+
+    def path(self, file_hash_key):
+        with self._lock:
+            return self._loaded().get(file_hash_key)
+
+    def snapshot(self):
+        """{file_hash_key: path} copy, safe to iterate while the library changes."""
+        with self._lock:
+            return dict(self._loaded())
+
+    def add(self, paths):
+        """paths -- {file_hash_key: path} of rows just written (or moved) in media_metadata."""
+        with self._lock:
+            if self._paths is not None:
+                self._paths.update(paths)
+
+    def discard(self, file_hash_keys):
+        with self._lock:
+            if self._paths is not None:
+                for file_hash_key in file_hash_keys:
+                    self._paths.pop(file_hash_key, None)
+
+    def invalidate(self):
+        """Forget everything, the next query reads media_metadata again (e.g. after a migration)."""
+        with self._lock:
+            self._paths = None
+
+
+fingerprints = FingerprintIndex()
@@ -0,0 +1,144 @@
+import os
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from directory_manager import load_paths
+from extract_metadata import get_file_hash, get_path
+
+
+# Concurrent reads per physical device. A spinning disk seeks itself to death with more than one or two
+# readers, an SSD / NVMe drive only gets going with several. Override per library root in settings.json:
+#     "hashing": {"device_concurrency": {"D:/Lib/movies": 1, "E:/Lib/series": 8}}
+HDD_CONCURRENCY = 1
+SSD_CONCURRENCY = 8
+DEFAULT_CONCURRENCY = 2         # device type unknown (no sysfs, e.g. Windows)
+MAX_PENDING = 1024              # queued reads across all devices before hash_files() waits for results
+
+
+# file_hash_key is None and error is set when the file couldn't be read
+HashResult = namedtuple('HashResult', ['file', 'root', 'tag', 'stat_result', 'file_hash_key', 'error', 'cached'])
+
+
+def detect_concurrency(device):
+    """Read limit for a st_dev, from /sys/dev/block/<major>:<minor> where available."""
+    try:
+        block = f'/sys/dev/block/{os.major(device)}:{os.minor(device)}'
+        queue_dir = os.path.join(block, 'queue')
+        if not os.path.isdir(queue_dir):
+            queue_dir = os.path.join(block, '..', 'queue')      # a partition, the queue belongs to its disk
+        with open(os.path.join(queue_dir, 'rotational')) as f:
+            return HDD_CONCURRENCY if f.read().strip() == '1' else SSD_CONCURRENCY
+    except (AttributeError, OSError, ValueError):
+        return DEFAULT_CONCURRENCY
+
+
+class HashingService:
+    """
+    get_file_hash() on a set of per-device thread pools.
+    Every device gets its own pool sized to its concurrency limit, so a slow disk never holds up the
+    reads queued for another one and a scan over several disks keeps all of them busy.
+    """
+
+    def __init__(self, device_limits=None):
+        self.device_limits = device_limits or {}       # st_dev: concurrent reads
+        self._executors = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, PATH=None):
+        if PATH is None:
+            try:
+                PATH = load_paths() or {}
+            except OSError:
+                PATH = {}       # no settings.json yet, detected limits only
+        device_limits = {}
+        for root, limit in PATH.get('hashing', {}).get('device_concurrency', {}).items():
+            try:
+                device_limits[os.stat(root).st_dev] = max(1, int(limit))
+            except (OSError, TypeError, ValueError) as e:
+                print(f'[ warning ] hashing: ignoring device_concurrency for "{root}": {e}')
+        return cls(device_limits)
+
+    def _executor(self, device):
+        with self._lock:
+            executor = self._executors.get(device)
+            if executor is None:
+                limit = self.device_limits.get(device) or detect_concurrency(device)
+                executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f'hash-{device}')
+                self._executors[device] = executor
+                print(f'[ debug ] hashing: device {device} -- {limit} concurrent reads')
+            return executor
+
+    def submit(self, file, root, stat_result=None):
+        stat_result = stat_result or os.stat(get_path(file, root))
+        return self._executor(stat_result.st_dev).submit(get_file_hash, file, root)
+
+    def hash_file(self, file, root):
+        """Single file, through the same device limits as a batch. Raises what get_file_hash() raises."""
+        return self.submit(file, root).result()
+
+    def hash_files(self, entries, cached=None, max_pending=MAX_PENDING):
+        """
+        Hash a stream of files, yielding a HashResult for each in completion order.
+
+        entries -- iterable of (file, root, tag), tag is handed back untouched; consumed lazily
+        cached  -- optional callable(path, stat_result) -> file_hash_key or None; a hit skips the read
+        """
+        pending = {}
+        finished = queue.SimpleQueue()      # futures land here as they complete
+
+        def collect(block):
+            while pending:
+                try:
+                    future = finished.get(block=block)
+                except queue.Empty:
+                    return
+                file, root, tag, stat_result = pending.pop(future)
+                try:
+                    yield HashResult(file, root, tag, stat_result, future.result(), None, False)
+                except Exception as e:
+                    yield HashResult(file, root, tag, stat_result, None, e, False)
+                block = False
+
+        for file, root, tag in entries:
+            path = get_path(file, root)
+            try:
+                stat_result = os.stat(path)
+            except OSError as e:
+                yield HashResult(file, root, tag, None, None, e, False)
+                continue
+
+            file_hash_key = cached(path, stat_result) if cached else None
+            if file_hash_key is not None:
+                yield HashResult(file, root, tag, stat_result, file_hash_key, None, True)
+                continue
+
+            future = self.submit(file, root, stat_result)
+            pending[future] = (file, root, tag, stat_result)
+            future.add_done_callback(finished.put)
+
+            yield from collect(block=len(pending) >= max_pending)
+
+        while pending:
+            yield from collect(block=True)
+
+    def shutdown(self):
+        with self._lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_hashing_service():
+    """Process-wide HashingService, shared by the startup scan and the watcher."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = HashingService.from_settings()
+        return _service
@@ -0,0 +1,64 @@
+import os
+import time
+import fnmatch
+import threading
+
+
+# Paths our own jobs create or delete inside the libraries (transcode outputs, replaced originals),
+# which MovieWatcher must not treat as library changes. Each entry belongs to an owner (e.g. one
+# transcode job) and expires after its TTL, so a job that dies can't hide a path forever.
+# Once the owner is done its entries linger for RELEASE_GRACE seconds -- the watcher gets the
+# events for the last writes / the delete of the source a moment after they happen.
+DEFAULT_TTL = 12 * 60 * 60
+RELEASE_GRACE = 10
+
+
+def normalize(path):
+    return os.path.normcase(os.path.normpath(path))
+
+
+class IgnoreRegistry:
+    def __init__(self):
+        self._paths = {}    # normalized path: {owner: expires_at}
+        self._globs = {}    # normalized glob: {owner: expires_at}
+        self._lock = threading.Lock()
+
+    def ignore(self, owner, paths=(), globs=(), ttl=DEFAULT_TTL):
+        """Ignore events for these paths and fnmatch patterns (e.g. 'D:/Lib/movies/*.tmp.mp4') on behalf of owner."""
+        expires_at = time.time() + ttl
+        with self._lock:
+            for path in paths:
+                self._paths.setdefault(normalize(path), {})[owner] = expires_at
+            for pattern in globs:
+                self._globs.setdefault(normalize(pattern), {})[owner] = expires_at
+
+    def release(self, owner, grace=RELEASE_GRACE):
+        """The owner is done -- its entries expire after grace seconds."""
+        expires_at = time.time() + grace
+        with self._lock:
+            for entries in (self._paths, self._globs):
+                for owners in entries.values():
+                    if owner in owners:
+                        owners[owner] = min(owners[owner], expires_at)
+
+    def is_ignored(self, path):
+        path = normalize(path)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if path in self._paths:
+                return True
+            return any(fnmatch.fnmatchcase(path, pattern) for pattern in self._globs)
+
+    def _expire(self, now):
+        # Call with the lock held
+        for entries in (self._paths, self._globs):
+            for key in list(entries):
+                owners = entries[key]
+                for owner in [owner for owner, expires_at in owners.items() if expires_at <= now]:
+                    del owners[owner]
+                if not owners:
+                    del entries[key]
+
+
+ignored = IgnoreRegistry()
@@ -0,0 +1,264 @@
+import os
+import time
+import queue
+import threading
+
+from directory_manager import load_paths
+from hashing import get_hashing_service
+from extract_metadata import (
+    get_path, get_extension, get_file_hash, get_video_metadata, ffmpeg_video_metadata,
+    get_all_subtitles, get_movie_metadata, get_series_metadata
+)
+from transcode import transcode_to_mp4_264_aac
+from db_inserts import insert_entries
+from tmdb_update import tmdb_api
+from progress import progress
+from fingerprint_index import fingerprints
+
+
+# Ingest of one new file, as a chain of stages connected by bounded queues:
+#   discover -> fingerprint -> probe -> subtitles -> [transcode] -> keyframe -> persist -> enrich
+# Each stage has its own worker threads. A full queue blocks the stage feeding it, so a slow stage
+# (transcode, the tmdb lookups) holds back the ones before it instead of piling up work in memory.
+# Worker counts and the queue size can be overridden in settings.json:
+#     "ingest": {"queue_size": 64, "workers": {"probe": 8, "enrich": 4}}
+QUEUE_SIZE = 32
+STAGE_WORKERS = {
+    'discover': 1,
+    'fingerprint': 4,       # reads are limited per device by the hashing service anyway
+    'probe': 4,
+    'subtitles': 2,
+    'transcode': 1,         # GPU bound
+    'keyframe': 2,
+    'persist': 1,           # single writer, SQLite serialises writes anyway
+    'enrich': 2,            # tmdb lookups, network bound
+}
+# Stages whose handler takes a list of jobs, up to this many at a time
+STAGE_BATCH = {
+    'persist': 64,
+}
+
+
+def is_streamable(results, file):
+    """Plays in the browser as is -- h264 / aac in an mp4 container, anything else gets transcoded."""
+    return results.get('video_codec') == 'h264' and results.get('audio_codec') == 'aac' and get_extension(file) == 'mp4'
+
+
+# Stage handlers take the job dict, update it and return the name of the stage it moves to next,
+# or None when the job is finished (or dropped). STAGE_BATCH handlers take a list of jobs and return
+# a list of next stages, one per job; a job they failed on its own carries job['error'].
+
+def discover(job):
+    if not os.path.exists(get_path(job['file'], job['root'])):
+        print(f'[ debug ] {job["file"]} -- gone before ingest, skipped')
+        return None
+    return 'fingerprint'
+
+
+def fingerprint(job):
+    if not job.get('file_hash_key'):
+        job['file_hash_key'] = get_hashing_service().hash_file(job['file'], job['root'])
+    if job['file_hash_key'] in fingerprints:
+        return None     # already in the library (e.g. reported by both the scan and the watcher)
+    return 'probe'
+
+
+def probe(job):
+    results = ffmpeg_video_metadata(get_video_metadata(job['file'], job['root'], job['file_hash_key']))
+    job['streamable'] = is_streamable(results, job['file'])
+    return 'subtitles'
+
+
+def subtitles(job):
+    # Before a transcode, the transcoded file has no subtitle streams left
+    job['subtitles'] = get_all_subtitles(job['file'], job['root'])
+    return 'keyframe' if job['streamable'] else 'transcode'
+
+
+def transcode(job):
+    job['file'] = transcode_to_mp4_264_aac(job['file'], job['root'])
+    job['file_hash_key'] = get_file_hash(job['file'], job['root'])
+    return 'keyframe'
+
+
+def keyframe(job):
+    # Builds the entry from the cached probe; the ffmpeg keyframe render is the real work here
+    if job['category'] == 'movies':
+        data = get_movie_metadata(job['file'], job['root'], job['file_hash_key'])
+    else:
+        data = get_series_metadata(job['file'], job['root'], job['file_hash_key'])
+    if job.get('subtitles'):
+        data['subtitles'] = job['subtitles']
+    job['data'] = data
+    return 'persist'
+
+
+def persist(jobs):
+    # Batched -- whatever is waiting in the queue is written in one transaction.
+    # If that fails the entries are written one by one, so only a bad one fails.
+    try:
+        inserted = set(insert_entries([job['data'] for job in jobs]))
+    except Exception as e:
+        print(f'[ warning ] Batch of {len(jobs)} entries failed ({e}), writing them one by one')
+        inserted = set()
+        for job in jobs:
+            try:
+                inserted.update(insert_entries([job['data']]))
+            except Exception as e:
+                job['error'] = e
+    # Only entries actually written get the tmdb lookup, already known ones are done here
+    return ['enrich' if job['file_hash_key'] in inserted else None for job in jobs]
+
+
+def enrich(job):
+    tmdb_api(job['file_hash_key'])
+    return None
+
+
+STAGES = [
+    ('discover', discover),
+    ('fingerprint', fingerprint),
+    ('probe', probe),
+    ('subtitles', subtitles),
+    ('transcode', transcode),
+    ('keyframe', keyframe),
+    ('persist', persist),
+    ('enrich', enrich),
+]
+
+
+class Stage:
+    def __init__(self, name, handler, workers, queue_size, batch=None):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.batch = batch
+        self.queue = queue.Queue(maxsize=queue_size)
+
+    def take(self):
+        """Next job, or with batching the next job plus whatever else is already queued."""
+        job = self.queue.get()
+        if not self.batch:
+            return job
+        jobs = [job]
+        while len(jobs) < self.batch:
+            try:
+                jobs.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+
+class IngestPipeline:
+    """Runs new files through STAGES. Fed by the startup scan and by the watcher."""
+
+    def __init__(self, workers=None, queue_size=QUEUE_SIZE):
+        workers = {**STAGE_WORKERS, **(workers or {})}
+        self.stages = {name: Stage(name, handler, max(1, int(workers[name])), queue_size, STAGE_BATCH.get(name))
+                       for name, handler in STAGES}
+        self._in_flight = set()         # paths currently somewhere in the pipeline
+        self._idle = threading.Condition()
+        self._started = False
+        # 'ingest' counts whole files, in flight from submit() until they leave the last stage
+        progress.register('ingest', *self.stages)
+
+    @classmethod
+    def from_settings(cls):
+        try:
+            settings = (load_paths() or {}).get('ingest', {})
+        except OSError:
+            settings = {}
+        return cls(settings.get('workers'), settings.get('queue_size', QUEUE_SIZE))
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for stage in self.stages.values():
+            for i in range(stage.workers):
+                threading.Thread(target=self._run, args=(stage,), name=f'ingest-{stage.name}-{i}', daemon=True).start()
+
+    def submit(self, category, file, root, file_hash_key=None, queued=False):
+        """
+        Queue a file for ingest; blocks while the pipeline is full. False if the file is already queued.
+        queued -- the file was already reported to the 'ingest' progress stage as queued (see submit_all)
+        """
+        if not queued:
+            progress.queued('ingest')
+
+        path = get_path(file, root)
+        with self._idle:
+            if path in self._in_flight:
+                progress.queued('ingest', -1)      # a duplicate, never admitted
+                return False
+            self._in_flight.add(path)
+
+        job = {'category': category, 'file': file, 'root': root, 'path': path,
+               'file_hash_key': file_hash_key, 'started': time.time()}
+        progress.started('ingest')
+        self._put('discover', job)
+        return True
+
+    def submit_all(self, entries, queued=False):
+        """submit() every (category, file, root); the whole list counts as queued from the start."""
+        entries = list(entries)
+        if not queued:
+            progress.queued('ingest', len(entries))
+        for category, file, root in entries:
+            self.submit(category, file, root, queued=True)
+
+    def join(self):
+        """Wait until every submitted file is finished."""
+        with self._idle:
+            self._idle.wait_for(lambda: not self._in_flight)
+
+    def _put(self, name, job):
+        progress.queued(name)
+        self.stages[name].queue.put(job)
+
+    def _run(self, stage):
+        while True:
+            taken = stage.take()
+            jobs = taken if stage.batch else [taken]
+            progress.started(stage.name, len(jobs))
+            try:
+                result = stage.handler(taken)
+                next_stages = result if stage.batch else [result]
+            except Exception as e:
+                print(f'[ warning ] {", ".join(job["file"] for job in jobs)} -- ingest failed at {stage.name}: {e}')
+                next_stages = [None] * len(jobs)
+                for job in jobs:
+                    job['error'] = e
+
+            for job, next_stage in zip(jobs, next_stages):
+                failed = 'error' in job
+                if failed and stage.batch:
+                    print(f'[ warning ] {job["file"]} -- ingest failed at {stage.name}: {job["error"]}')
+                progress.finished(stage.name, failed=failed)
+                if next_stage:
+                    self._put(next_stage, job)
+                else:
+                    self._finish(job, stage, failed)
+                stage.queue.task_done()
+
+    def _finish(self, job, stage, failed=False):
+        if stage.name == 'enrich':
+            print(f'[ debug ] {job["file"]} -- Entry processed in {time.time() - job["started"]:.3f}s')
+        progress.finished('ingest', failed=failed)
+        with self._idle:
+            self._in_flight.discard(job['path'])
+            self._idle.notify_all()
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """Process-wide, started IngestPipeline."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = IngestPipeline.from_settings()
+            _pipeline.start()
+        return _pipeline
@@ -1,221 +1,216 @@
 import os
+import json
 import time
 import threading
 
 from extract_metadata import *
 from db_inserts import *
-from transcode import *
-from library_scanner import initialize_scanner
+from library_scanner import iter_library
+from directory_manager import load_paths
+from file_state import FileStateIndex, DirectoryIndex
+from hashing import get_hashing_service
+from ingest_pipeline import get_pipeline
+from progress import progress
+from reconciler import reconcile
+from fingerprint_index import fingerprints
 from db_connect import get_db_connection
-from tmdb_update import tmdb_api
-
-def get_hash_list_from_db():
-    conn = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        results = cursor.execute("SELECT file_hash_key FROM media_metadata").fetchall()
-        hash_list = [row[0] for row in results]
-        return hash_list
-    except Exception as e:
-        print(f"Error fetching hash list: {e}")
-        return []
-    finally:
-        if conn:
-            conn.close()
-
+from load_data import MediaItem
+from library_state import bump_generation
 
 def verify_library_integrity(*categories):
-    # files output:
-    # {
-    #     'movies': [(category, file, path), (category, file, path), ...],
-    #     'series': [(category, file, path), (category, file, path), ...]
-    # }
+    # returns three change sets (see reconciler.LibraryChanges):
+    #     new_entries_list:     [(category, file, root), ...]
+    #     missing_entries_list: [file_hash_key, ...]
+    #     moved_entries_list:   [MovedFile(file_hash_key, old_path, new_path, category, file, root), ...]
 
     start_time = time.time() # debug
     print(f"[ debug ] Verifying library integrity...")
 
-    files = initialize_scanner(*categories)
-
-
-
-    database_hash_list = get_hash_list_from_db()    # list of first 2 Mb hashed contents of a file
+    if not load_paths():
+        return [], [], []
 
+    progress.reset('scan')                          # counts files of this scan only
 
-    local_hash_list = []
-    new_entries_list = []
-    missing_entries_list = []
-    if files:
-        for category, items in files.items():
-            for item in items:
-                file, root = item
-                hash = get_file_hash(file, root)
+    known_files = fingerprints.snapshot()           # {file_hash_key: path}
+    file_states = FileStateIndex.load()             # only files whose size / mtime / inode changed get re-hashed
+    directories = DirectoryIndex.load()             # only directories whose mtime changed get listed
 
-                local_hash_list.append(hash)
+    # Files are hashed and diffed as the walker yields them, nothing is materialised up front.
+    # Roots are walked interleaved so every disk has reads queued on its pool from the start.
+    hashed_entries = file_states.hash_entries(iter_library(*categories, interleave=True, directories=directories), get_hashing_service(), stage='scan')
+    changes = reconcile(hashed_entries, known_files)
 
-                if hash in database_hash_list:
-                    continue
-                print(f'[ debug ] New entry -- {item}')
-                new_entries_list.append((category, file, root))
-    
-        for hash in database_hash_list:
-            if hash not in local_hash_list:
-                missing_entries_list.append(hash)
+    file_states.save(prune=True)
+    directories.save(prune=True)
 
 
 
     end_time = time.time()
     duration = end_time - start_time
     print(f"\n[ debug ] library scan completed in {duration:.3f}s")
+    print(f"[ debug ] New: {len(changes.added)}, missing: {len(changes.removed)}, moved: {len(changes.moved)}")
 
-    return new_entries_list, missing_entries_list
-
-
-
-
-
-
+    return changes.added, changes.removed, changes.moved
 
-def check_entries_compatibility(files):
-   
-    compatible_files = []
-    incompatible_files = []
-    
-    for file in files:
-        category, file, root = file
 
-        ffprobe_metadata = get_video_metadata(file, root)
-        results = ffmpeg_video_metadata(ffprobe_metadata)
 
-        video_codec = results.get('video_codec')
-        audio_codec = results.get('audio_codec')
-        extension = get_extension(file)
+def remove_missing(missing_entries_list, repair_counts=False):
+    removed = delete_entries(missing_entries_list, repair_counts)
+    print(f"[ debug ] Missing entries removed: {removed}")
 
-        if not (video_codec == 'h264' and audio_codec == 'aac' and extension == 'mp4'):
-            incompatible_files.append((category, file, root))
-            continue
+    # Deletes don't bump entry_updated, so cached detail pages can't notice them on their own
+    MediaItem.invalidate_detail_cache()
 
-        compatible_files.append((category, file, root))
 
-    print(f'[ debug ] New compatible entries: {len(compatible_files)}')
-    print(f'[ debug ] New incompatible entries: {len(incompatible_files)}')
+def remove_paths(paths):
+    """Files or whole folders gone from disk -- drop what the library has at or below these paths."""
+    removed = delete_paths(paths)
+    print(f"[ debug ] Entries removed for {len(paths)} deleted path(s): {removed}")
 
-    return compatible_files, incompatible_files
+    if removed:
+        MediaItem.invalidate_detail_cache()
 
 
 
-def remove_missing(missing_entries_list):
+def apply_moves(moved_entries_list):
+    """Known files found at a new path -- point media_metadata at it, no re-ingest."""
     conn = get_db_connection()
     cursor = conn.cursor()
-        
-    for item in missing_entries_list:
-        cursor.execute("DELETE FROM media_metadata WHERE file_hash_key = ?", (item,))
 
-    print(f"[ debug ] Missing entries removed: {len(missing_entries_list)}")
+    cursor.executemany("UPDATE media_metadata SET path = ? WHERE file_hash_key = ?",
+                       [(entry.new_path, entry.file_hash_key) for entry in moved_entries_list])
+
+    print(f"[ debug ] Moved entries updated: {len(moved_entries_list)}")
 
     conn.commit()
-    conn.close()   
+    conn.close()
 
+    fingerprints.add({entry.file_hash_key: entry.new_path for entry in moved_entries_list})
 
+    MediaItem.invalidate_detail_cache()
+    bump_generation()
 
-def process_compatible(item):
-    start_time = time.time()
 
-    category, file, root = item
 
-    subtitles = get_all_subtitles(file, root)
-    
+def media_identity(category, path):
+    """What a file is in the library, as far as its path tells -- (category, parsed title)."""
+    file, root = os.path.basename(path), os.path.dirname(path)
     if category == 'movies':
-        data = get_movie_metadata(file, root)
-        if subtitles:
-            data['subtitles'] = subtitles
-        insert_movie(data)
-        tmdb_api(data.get('file_hash_key'))
-
-
+        return category, get_title(file)
+    return category, get_series_title(file, root)
 
-    if category == 'series':
-        data = get_series_metadata(file, root)
-        if subtitles:
-            data['subtitles'] = subtitles
-        insert_tv_series(data)
-        tmdb_api(data.get('file_hash_key'))
 
-    end_time = time.time()
-    duration = end_time - start_time
-    print(f'[ debug ] {file} -- Entry processed in {duration:.3f}s')
+def apply_path_moves(moves):
+    """
+    Files or folders renamed / moved inside the libraries (watcher move events).
+    moves -- [(src, dest, src_category, dest_category)], applied in order
 
+    Paths in media_metadata, media_subtitles and file_state are rewritten in place, nothing is probed again.
+    Files whose category or parsed title changed are removed instead and returned for a fresh ingest.
+    Returns (reingest [(category, file, root, file_hash_key)], unmatched moves with nothing in the library).
+    """
+    # Stored paths use forward slashes (see extract_metadata.get_path).
+    # Every move is rewritten to go from what the database has to where the file ends up after the whole batch.
+    chained = []
+    for src, dest, src_category, dest_category in moves:
+        src, dest = src.replace("\\", "/").rstrip("/"), dest.replace("\\", "/").rstrip("/")
 
-        
+        # Moved earlier in the batch: A -> B then B -> C is A -> C, A -> B then B/x -> B/y is A/x -> B/y
+        earlier = next((move for move in reversed(chained) if src == move[1] or src.startswith(move[1] + '/')), None)
 
+        # Whatever earlier moves put at or below src moves on with it
+        for i, (earlier_src, earlier_dest, earlier_src_category, _) in enumerate(chained):
+            if earlier_dest == src or earlier_dest.startswith(src + '/'):
+                chained[i] = (earlier_src, dest + earlier_dest[len(src):], earlier_src_category, dest_category)
 
-def process_incompatible(item):
-    start_time = time.time()
+        if earlier is not None:
+            if earlier[1] == src:
+                continue    # folded into the earlier move
+            src, src_category = earlier[0] + src[len(earlier[1]):], earlier[2]
 
-    category, file, root = item
+        chained.append((src, dest, src_category, dest_category))
+    moves = chained
 
-    subtitles = get_all_subtitles(file, root) # subs need to be extracted before transcoding
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        rows = cursor.execute('''
+            SELECT m.file_hash_key, m.path, CAST(j.key AS INTEGER) FROM media_metadata m
+            JOIN json_each(?) j ON m.path = j.value OR substr(m.path, 1, length(j.value) + 1) = j.value || '/'
+        ''', (json.dumps([src for src, _, _, _ in moves]),)).fetchall()
+
+        # A file matched by its folder's move and its own: the most specific (longest src) one decides
+        rows.sort(key=lambda row: len(moves[row[2]][0]), reverse=True)
+
+        matched = set()
+        decided = set()
+        new_paths = {}          # file_hash_key: new path
+        reingest = []
+        for file_hash_key, path, index in rows:
+            src, dest, src_category, dest_category = moves[index]
+            matched.add(index)
+            new_path = dest + path[len(src):]
+            if file_hash_key in decided:
+                continue
+            decided.add(file_hash_key)
+            if new_path == path:
+                continue
+
+            if media_identity(src_category, path) != media_identity(dest_category, new_path):
+                reingest.append((dest_category, os.path.basename(new_path), os.path.dirname(new_path), file_hash_key))
+            else:
+                new_paths[file_hash_key] = new_path
+
+        cursor.executemany("UPDATE media_metadata SET path = ? WHERE file_hash_key = ?",
+                           [(path, file_hash_key) for file_hash_key, path in new_paths.items()])
+
+        # Subtitles sit in subs_<name> folders next to the video, they only move with a whole folder.
+        # Stored paths may mix separators, they come out of the rewrite with forward slashes.
+        # Most specific first, so a file's own move isn't pre-empted by its folder's
+        for src, dest, _, _ in sorted(moves, key=lambda move: len(move[0]), reverse=True):
+            cursor.execute('''
+                UPDATE media_subtitles SET subtitle_path = ? || substr(replace(subtitle_path, '\\', '/'), length(?) + 1)
+                WHERE substr(replace(subtitle_path, '\\', '/'), 1, length(?) + 1) = ? || '/'
+            ''', (dest, src, src, src))
+            # Same inode and size afterwards, so the next scan keeps using the stored hashes
+            cursor.execute('''
+                UPDATE OR REPLACE file_state SET path = ? || substr(path, length(?) + 1)
+                WHERE path = ? OR substr(path, 1, length(?) + 1) = ? || '/'
+            ''', (dest, src, src, src, src))
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-    file = transcode_to_mp4_264_aac(file, root)
-    
-    if category == 'movies':
-        data = get_movie_metadata(file, root)
-        if subtitles:
-            data['subtitles'] = subtitles
-        insert_movie(data)
-        tmdb_api(data.get('file_hash_key'))
-
-    if category == 'series':
-        data = get_series_metadata(file, root)
-        if subtitles:
-            data['subtitles'] = subtitles
-        insert_tv_series(data)
-        tmdb_api(data.get('file_hash_key'))
+    print(f"[ debug ] Moved entries updated: {len(new_paths)}, renamed to a different title: {len(reingest)}")
 
-    end_time = time.time()
-    duration = end_time - start_time
-    print(f'[ debug ] {file} -- Entry processed in {duration:.3f}s')
+    if new_paths:
+        fingerprints.add(new_paths)
+        MediaItem.invalidate_detail_cache()
+        bump_generation()
+    if reingest:
+        remove_missing([entry[3] for entry in reingest])
 
+    unmatched = [move for index, move in enumerate(moves) if index not in matched]
+    return reingest, unmatched
 
 
-from queue_tasks import add_to_queue
 
 def library_manager():
-    new_entries_list, missing_entries_list = verify_library_integrity('movies', 'series')
-
-    if missing_entries_list:
-        remove_missing(missing_entries_list)
-
-    compatible_files, incompatible_files = check_entries_compatibility(new_entries_list)
-
-
-    if compatible_files:
-        for file in compatible_files:
-            process_compatible(file)
-
-    if incompatible_files:
-        for file in incompatible_files:
-            add_to_queue(file)
-
-
-    # threading.Thread(target=process_incompatible, args=(incompatible_files,), daemon=True).start()
-
-
- 
-
-
-
-
-
-
-
-
-
-
-
- 
-
-
-
+    new_entries_list, missing_entries_list, moved_entries_list = verify_library_integrity('movies', 'series')
 
+    if moved_entries_list:
+        apply_moves(moved_entries_list)
 
+    if missing_entries_list:
+        # Possibly thousands of rows at once, recount media_counts after it
+        remove_missing(missing_entries_list, repair_counts=True)
+
+    # New files go through the ingest pipeline in the background, the web server doesn't wait for them
+    if new_entries_list:
+        # Counted as queued right away, the feeding thread blocks behind the pipeline's bounded queues
+        progress.queued('ingest', len(new_entries_list))
+        threading.Thread(target=get_pipeline().submit_all, args=(new_entries_list, True), daemon=True).start()
@@ -1,9 +1,11 @@
 import os
+import time
 
 from extract_metadata import *
 from directory_manager import load_paths
 
 
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv", ".webm")
 
 
 
@@ -14,47 +16,113 @@ def initialize_scanner(*categories):
         return
         #raise ValueError("No paths loaded. Check your configuration.")
 
+    all_results = {category: [] for category in categories}
+    for category, file, root in iter_library(*categories, PATH=PATH):
+        all_results[category].append((file, root))
+
+    return all_results
+
+
+def iter_library(*categories, PATH=None, interleave=False, directories=None):
+    """
+    Yields (category, file, root) for every video under the configured library paths, as it is found.
+    With interleave=True the roots are walked round-robin instead of one after the other.
+    directories -- optional file_state.DirectoryIndex, unchanged directories aren't listed again
+    """
+    PATH = PATH or load_paths()
+    if not PATH:
+        return
+
     # Get paths for movies and series
     libraries = PATH.get("libraries", {})
-    all_results = {}
 
+    # One walker per (category, root)
+    walkers = [_tagged(category, iter_scanner(path, category, directories))
+               for category in categories
+               for path in libraries.get(category, [])]
 
-    # Iterate over each category provided
-    for category in categories:
-        paths = libraries.get(category, [])  # Get paths for the specific category
-        category_results = []
+    if not interleave:
+        for walker in walkers:
+            yield from walker
+        return
 
-        # Scan each path for the current category
-        for path in paths:
-            results = scanner(path, category)
-            if results:
-                category_results.extend(results)
+    while walkers:
+        for walker in list(walkers):
+            entry = next(walker, None)
+            if entry is None:
+                walkers.remove(walker)
+                continue
+            yield entry
 
-        # If there were results for this category, add them to the dictionary
-        if category_results:
-            all_results[category] = category_results
-        else:
-            all_results[category] = []
 
-    return all_results
 
 
 
+def _tagged(category, files):
+    for file, root in files:
+        yield category, file, root
 
 
 def scanner(path, category):
     """Scans a given directory for movies or series."""
-    results = []
-    count = 0
-    for root, _, files in os.walk(path):
-        for file in files:
-            if not file.endswith((".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv", ".webm")):
+    return list(iter_scanner(path, category))
+
+
+def iter_scanner(path, category, directories=None):
+    """
+    Yields (file, root) for each video in a given directory for movies or series.
+    Walks with os.scandir; with a DirectoryIndex a directory whose mtime is unchanged since the last
+    scan is served from the stored listing. Its subdirectories still get a stat each, a change deeper
+    down doesn't touch the parent's mtime.
+    """
+    start_time = time.time()
+    count = listed = reused = 0
+
+    stack = [(os.path.normpath(path), None)]       # (directory, mtime_ns if already known)
+    while stack:
+        directory, mtime_ns = stack.pop()
+        try:
+            if mtime_ns is None:
+                mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError as e:
+            print(f'[ warning ] Could not scan "{directory}": {e}')
+            continue
+
+        listing = directories.lookup(directory, mtime_ns) if directories else None
+        if listing is not None:
+            reused += 1
+            files, subdirs = listing
+            children = [(os.path.join(directory, name), None) for name in subdirs]
+        else:
+            listed += 1
+            files, subdirs, children = [], [], []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            is_dir = entry.is_dir() and not entry.is_symlink()
+                        except OSError:
+                            is_dir = False
+                        if is_dir:
+                            subdirs.append(entry.name)
+                            try:
+                                # free on Windows (comes with the listing), one stat elsewhere
+                                children.append((entry.path, entry.stat(follow_symlinks=False).st_mtime_ns))
+                            except OSError:
+                                children.append((entry.path, None))
+                        elif entry.name.endswith(VIDEO_EXTENSIONS):
+                            files.append(entry.name)
+            except OSError as e:
+                print(f'[ warning ] Could not scan "{directory}": {e}')
                 continue
-            
-            count += 1
-            results.append((file, os.path.normpath(root)))
+            if directories:
+                directories.record(directory, mtime_ns, files, subdirs)
 
-    print(f'[ debug ] Found {count} files in "{path}"')
-    return results
+        for file in files:
+            count += 1
+            yield file, directory
 
+        stack.extend(reversed(children))
 
+    print(f'[ debug ] Found {count} files in "{path}" in {time.time() - start_time:.3f}s '
+          f'({listed} directories listed, {reused} unchanged)')
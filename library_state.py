@@ -0,0 +1,32 @@
+import time
+import threading
+
+
+# Generation numbers of what the pages show.
+#   'library' -- media items, metadata, tmdb data. Bumped by ingest, removals and tmdb updates.
+#   'user'    -- ratings, watchlist and watched flags. Bumped by the submit_* routes.
+# Caches and HTTP validators keyed on them go stale on every bump.
+# Seeded with the start time so a restart never reuses a number from a previous run.
+_started = time.time()
+_versions = {
+    'library': [int(_started * 1000), _started],    # [generation, changed_at]
+    'user': [int(_started * 1000), _started],
+}
+_lock = threading.Lock()
+
+
+def get_generation(scope='library'):
+    return _versions[scope][0]
+
+
+def changed_at(scope='library'):
+    """Unix time of the last bump (or of process start)."""
+    return _versions[scope][1]
+
+
+def bump_generation(scope='library'):
+    with _lock:
+        version = _versions[scope]
+        version[0] += 1
+        version[1] = time.time()
+        return version[0]
@@ -1,8 +1,165 @@
+import json
+import base64
 import sqlite3
+from contextlib import closing
 from datetime import datetime
 
+from db_connect import get_db_connection
+from cache import LRUCache
 
 
+# Per-item relations that can be bulk-loaded for a page of media_items ids.
+# Each query must return (media_item_id, value) pairs for the ids bound to {placeholders}.
+RELATION_QUERIES = {
+    'genres': '''
+        SELECT mg.media_item_id, g.genre
+        FROM media_genres mg
+        JOIN genres g ON mg.genre_id = g.id
+        WHERE mg.media_item_id IN ({placeholders})
+        ORDER BY mg.media_item_id, g.id''',
+}
+
+SQLITE_MAX_VARIABLES = 900  # stay below the default SQLITE_MAX_VARIABLE_NUMBER of older sqlite builds
+
+
+def load_relation(conn, relation, ids):
+    """Fetch one relation for many media_items ids at once. Returns {media_item_id: [values]}."""
+    query = RELATION_QUERIES[relation]
+    ids = list(dict.fromkeys(ids))
+    grouped = {media_id: [] for media_id in ids}
+
+    for start in range(0, len(ids), SQLITE_MAX_VARIABLES):
+        chunk = ids[start:start + SQLITE_MAX_VARIABLES]
+        placeholders = ', '.join('?' for _ in chunk)
+        for media_id, value in conn.execute(query.format(placeholders=placeholders), chunk):
+            grouped[media_id].append(value)
+
+    return grouped
+
+
+PAGINATION_COLUMNS = ('entry_updated', 'title')
+
+
+def encode_page_token(column, value, item_id, direction='next'):
+    """Pack a keyset position into an opaque, url safe token."""
+    raw = json.dumps([column, value, item_id, direction], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_page_token(token, column):
+    """Return ((value, id), direction) for a token issued for `column`, or (None, 'next') if it is missing or invalid."""
+    if not token:
+        return None, 'next'
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        token_column, value, item_id, direction = json.loads(raw)
+    except (ValueError, TypeError):
+        return None, 'next'
+    if token_column != column or token_column not in PAGINATION_COLUMNS or direction not in ('next', 'prev'):
+        return None, 'next'
+    if not isinstance(value, (str, int, float)) or not isinstance(item_id, int):
+        return None, 'next'
+    return (value, item_id), direction
+
+
+def seek_condition(column, key, direction):
+    """
+    WHERE clause selecting rows after (direction='next') or before (direction='prev') `key`
+    in `column` DESC, id DESC order. Row values keep it a single index range scan.
+    """
+    if direction == 'prev':
+        return f'({column}, id) > (?, ?)', list(key)
+    return f'({column}, id) < (?, ?)', list(key)
+
+
+DETAIL_CACHE_SIZE = 128     # assembled MediaItem detail objects kept per process
+_detail_cache = LRUCache(DETAIL_CACHE_SIZE)
+
+SEARCH_RESULT_LIMIT = 50
+_search_tokenizers = {}
+
+
+def search_tokenizer(conn):
+    """'trigram', 'unicode61' or None (no media_search table) -- looked up once per database file."""
+    db_file = conn.execute('PRAGMA database_list').fetchone()['file']
+    if db_file not in _search_tokenizers:
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'media_search'").fetchone()
+        if row is None:
+            return None
+        _search_tokenizers[db_file] = 'trigram' if 'trigram' in row['sql'] else 'unicode61'
+    return _search_tokenizers[db_file]
+
+
+def build_match_query(input_str, tokenizer):
+    """Turn user input into an FTS5 MATCH expression, or None when FTS can't answer it."""
+    words = input_str.replace('"', ' ').split()
+    if not words or tokenizer is None:
+        return None
+
+    if tokenizer == 'trigram':
+        # Trigrams need at least 3 characters per term to match anything
+        if any(len(word) < 3 for word in words):
+            return None
+        return ' AND '.join(f'"{word}"' for word in words)
+
+    return ' AND '.join(f'"{word}"*' for word in words)
+
+
+
+
+class MediaCard:
+    """
+    Slim projection of a media_items row for list views (cards, watchlist, search JSON).
+    Carries only what the card templates and to_dict read; MediaItem is reserved for the detail page.
+    """
+    __slots__ = ('id', 'category', 'title', 'release_date', 'description', 'poster_path', 'entry_updated', 'genres')
+
+    def __init__(self, id=None, category=None, title=None, release_date=None, description=None,
+                 poster_path=None, entry_updated=None, genres=None):
+        self.id = id
+        self.category = category
+        self.title = title
+        self.release_date = release_date
+        self.description = description
+        self.poster_path = poster_path
+        self.entry_updated = entry_updated
+        self.genres = genres or []
+
+    def __getitem__(self, key):
+        # Templates use both item['title'] and item.title
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    @classmethod
+    def hydrate(cls, conn, rows, relations=('genres',)):
+        """Build cards from media_items rows and attach each relation with one query per page, not per row."""
+        items = [cls(**dict(row)) for row in rows]
+        if not items:
+            return items
+
+        ids = [item.id for item in items]
+        for relation in relations:
+            grouped = load_relation(conn, relation, ids)
+            for item in items:
+                setattr(item, relation, grouped.get(item.id, []))
+
+        return items
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'poster_path': self.poster_path,
+            'category': self.category,
+            'release_date': self.release_date,
+            'genres': self.genres
+        }
+
+
+CARD_COLUMNS = 'id, category, title, release_date, description, poster_path, entry_updated'
+
 
 class MediaItem:
     def __init__(self, id=None, category=None, title=None, release_date=None, description=None, tagline=None, origin_country=None, 
@@ -40,133 +197,126 @@ class MediaItem:
 
     @staticmethod
     def get_db_connection():
-        conn = sqlite3.connect('library.db')
-        conn.row_factory = sqlite3.Row  # Enables column access by name
-        return conn
+        return get_db_connection()
 
 
     @classmethod
     def load_by_id(cls, media_id):
         """Load a single media item by its ID, including connected genres, movie or TV details"""
         try:
-            with cls.get_db_connection() as conn:
-                # Query for the main media item
-                media_item_data = conn.execute('''
-                    SELECT * 
-                    FROM media_items 
+            with closing(cls.get_db_connection()) as conn:
+                # Cheap primary key probe, the assembled item is reused while its timestamps are unchanged
+                version = conn.execute('''
+                    SELECT entry_updated, api_updated
+                    FROM media_items
                     WHERE id = ?''', (media_id,)).fetchone()
 
-                if media_item_data is None:
+                if version is None:
                     print(f"[ debug ] No media item found with ID: {media_id}")
+                    _detail_cache.pop(media_id)
                     return None
 
-                print(f"[ debug ] Media item found: {media_item_data['title']}")
-
-                # Movie details (if category is movie)
-                movie_details = None
-                if media_item_data['category'] == "movie":
-                    movie_details = conn.execute('''
-                        SELECT * 
-                        FROM movie_details 
-                        WHERE media_item_id = ?''', (media_id,)).fetchone()
-
-                # TV series details (if category is series)
-                tv_series_details = None
-                if media_item_data['category'] == "series":
-                    tv_series_details = conn.execute('''
-                        SELECT * 
-                        FROM tv_series_details 
-                        WHERE media_item_id = ?''', (media_id,)).fetchone()
-
-                # Fetch associated genres
-                genres_data = conn.execute('''
-                    SELECT g.genre 
-                    FROM media_genres mg
-                    JOIN genres g ON mg.genre_id = g.id
-                    WHERE mg.media_item_id = ?''', (media_id,)).fetchall()
-
-                genres = [genre['genre'] for genre in genres_data]
-
-                # Fetch TV seasons (if it's a TV series)
-                tv_seasons = []
-                if media_item_data['category'] == 'series':
-                    seasons_data = conn.execute('''
-                        SELECT * 
-                        FROM tv_seasons 
-                        WHERE media_item_id = ?''', (media_id,)).fetchall()
-
-                    for season in seasons_data:
-                        tv_seasons.append({
-                            'season': season['season'],
-                            'air_date': season['air_date'],
-                            'episode_count': season['episode_count'],
-                            'season_name': season['season_name'],
-                            'overview': season['overview'],
-                            'season_poster_path': season['season_poster_path'],
-                            'latest_episode_entry': season['latest_episode_entry']
-                        })
-
-                # Fetch media metadata (both for movies and episodes)
-                media_metadata = []
-                metadata_data = conn.execute('''
-                    SELECT * 
-                    FROM media_metadata 
-                    WHERE media_item_id = ?''', (media_id,)).fetchall()
-
-                for metadata in metadata_data:
-                    media_metadata.append({
-                        'id': metadata['id'],
-                        'media_item_id': metadata['media_item_id'],
-                        'season': metadata['season'],
-                        'episode': metadata['episode'],
-                        'resolution': metadata['resolution'],
-                        'extension': metadata['extension'],
-                        'path': metadata['path'],
-                        'file_size': metadata['file_size'],
-                        'duration': metadata['duration'],
-                        'audio_codec': metadata['audio_codec'],
-                        'video_codec': metadata['video_codec'],
-                        'bitrate': metadata['bitrate'],
-                        'frame_rate': metadata['frame_rate'],
-                        'width': metadata['width'],
-                        'height': metadata['height'],
-                        'aspect_ratio': metadata['aspect_ratio'],
-                        'file_hash_key': metadata['file_hash_key'],
-                        'key_frame': metadata['key_frame']
-                    })
-
-                return cls(
-                    id=media_item_data['id'],
-                    category=media_item_data['category'],
-                    title=media_item_data['title'],
-                    release_date=media_item_data['release_date'],
-                    description=media_item_data['description'],
-                    tagline=media_item_data['tagline'],
-                    origin_country=media_item_data['origin_country'],
-                    spoken_languages=media_item_data['spoken_languages'],
-                    studio=media_item_data['studio'],
-                    production_countries=media_item_data['production_countries'],
-                    popularity=media_item_data['popularity'],
-                    vote_average=media_item_data['vote_average'],
-                    vote_count=media_item_data['vote_count'],
-                    status=media_item_data['status'],
-                    poster_path=media_item_data['poster_path'],
-                    backdrop_path=media_item_data['backdrop_path'],
-                    title_hash_key=media_item_data['title_hash_key'],
-                    tmdb_id=media_item_data['tmdb_id'],
-                    imdb_id=media_item_data['imdb_id'],
-                    entry_updated=media_item_data['entry_updated'],
-                    movie_details=movie_details or {},
-                    tv_series_details=tv_series_details or {},
-                    genres=genres or [],
-                    tv_seasons=sorted(tv_seasons or [], key=lambda x: x['season']),  # Sort by 'season' before passing
-                    media_metadata=media_metadata or []
-                )
+                cached = _detail_cache.get(media_id)
+                if cached and cached[0] == tuple(version):
+                    return cached[1]
+
+                version, media_item = cls._load_detail(conn, media_id)
+                if media_item is not None:
+                    _detail_cache.set(media_id, (version, media_item))
+                return media_item
 
         except sqlite3.DatabaseError as e:
             print(f"Error while querying database: {e}")
             return None     
 
+    @classmethod
+    def _load_detail(cls, conn, media_id):
+        """Item, movie/tv details, genres and seasons in one query, media metadata in a second one."""
+        media_item_data = conn.execute('''
+            SELECT
+                mi.*,
+                (SELECT json_object(
+                        'id', md.id, 'media_item_id', md.media_item_id, 'budget', md.budget,
+                        'revenue', md.revenue, 'duration', md.duration)
+                    FROM movie_details md
+                    WHERE md.media_item_id = mi.id AND mi.category = 'movie'
+                    ORDER BY md.id LIMIT 1) AS movie_details_json,
+                (SELECT json_object(
+                        'id', td.id, 'media_item_id', td.media_item_id, 'created_by', td.created_by,
+                        'first_air_date', td.first_air_date, 'last_air_date', td.last_air_date,
+                        'next_episode_to_air', td.next_episode_to_air, 'number_of_episodes', td.number_of_episodes,
+                        'number_of_seasons', td.number_of_seasons, 'in_production', td.in_production)
+                    FROM tv_series_details td
+                    WHERE td.media_item_id = mi.id AND mi.category = 'series'
+                    ORDER BY td.id LIMIT 1) AS tv_series_details_json,
+                (SELECT json_group_array(genre) FROM (
+                    SELECT g.genre
+                    FROM media_genres mg
+                    JOIN genres g ON mg.genre_id = g.id
+                    WHERE mg.media_item_id = mi.id
+                    ORDER BY g.id)) AS genres_json,
+                (SELECT json_group_array(json_object(
+                        'season', ts.season, 'air_date', ts.air_date, 'episode_count', ts.episode_count,
+                        'season_name', ts.season_name, 'overview', ts.overview,
+                        'season_poster_path', ts.season_poster_path, 'latest_episode_entry', ts.latest_episode_entry))
+                    FROM tv_seasons ts
+                    WHERE ts.media_item_id = mi.id AND mi.category = 'series') AS tv_seasons_json
+            FROM media_items mi
+            WHERE mi.id = ?''', (media_id,)).fetchone()
+
+        if media_item_data is None:
+            return None, None
+
+        print(f"[ debug ] Media item found: {media_item_data['title']}")
+
+        # Fetch media metadata (both for movies and episodes)
+        metadata_data = conn.execute('''
+            SELECT * 
+            FROM media_metadata 
+            WHERE media_item_id = ?''', (media_id,)).fetchall()
+
+        media_metadata = [dict(metadata) for metadata in metadata_data]
+        tv_seasons = json.loads(media_item_data['tv_seasons_json'])
+
+        media_item = cls(
+            id=media_item_data['id'],
+            category=media_item_data['category'],
+            title=media_item_data['title'],
+            release_date=media_item_data['release_date'],
+            description=media_item_data['description'],
+            tagline=media_item_data['tagline'],
+            origin_country=media_item_data['origin_country'],
+            spoken_languages=media_item_data['spoken_languages'],
+            studio=media_item_data['studio'],
+            production_countries=media_item_data['production_countries'],
+            popularity=media_item_data['popularity'],
+            vote_average=media_item_data['vote_average'],
+            vote_count=media_item_data['vote_count'],
+            status=media_item_data['status'],
+            poster_path=media_item_data['poster_path'],
+            backdrop_path=media_item_data['backdrop_path'],
+            title_hash_key=media_item_data['title_hash_key'],
+            tmdb_id=media_item_data['tmdb_id'],
+            imdb_id=media_item_data['imdb_id'],
+            entry_updated=media_item_data['entry_updated'],
+            api_updated=media_item_data['api_updated'],
+            movie_details=json.loads(media_item_data['movie_details_json'] or '{}'),
+            tv_series_details=json.loads(media_item_data['tv_series_details_json'] or '{}'),
+            genres=json.loads(media_item_data['genres_json']),
+            tv_seasons=sorted(tv_seasons, key=lambda x: x['season']),  # Sort by 'season' before passing
+            media_metadata=media_metadata
+        )
+        version = (media_item_data['entry_updated'], media_item_data['api_updated'])
+        return version, media_item
+
+    @staticmethod
+    def invalidate_detail_cache(media_id=None):
+        """Drop cached detail pages after writes that don't touch entry_updated / api_updated (e.g. deletes)."""
+        if media_id is None:
+            _detail_cache.clear()
+        else:
+            _detail_cache.pop(media_id)
+
 
 
     @classmethod
@@ -188,31 +338,20 @@ class MediaItem:
         else:
             media_items = []
 
+        items = MediaCard.hydrate(conn, media_items, relations=())
         conn.close()
 
-        items = []
-        for item in media_items:
-            media_item = cls(**dict(item))    
-            items.append(media_item)    
-        # Return the count (the result is a tuple, so we extract the first element)
         return items
 
     @classmethod
     def get_total_media_count(cls, category=None):
+        """Read the trigger maintained media_counts row ('*' when no category is given)."""
         conn = cls.get_db_connection()
-        
-        if category:
-            # If category is provided, filter by category
-            query = 'SELECT COUNT(*) FROM media_items WHERE category = ?'
-            result = conn.execute(query, (category,)).fetchone()
-        else:
-            # If no category is provided, count all media items
-            query = 'SELECT COUNT(*) FROM media_items'
-            result = conn.execute(query).fetchone()
-        
+
+        result = conn.execute('SELECT total FROM media_counts WHERE category = ?', (category or '*',)).fetchone()
+
         conn.close()
-        
-        # Return the count (the result is a tuple, so we extract the first element)
+
         return result[0] if result else 0
 
     @classmethod
@@ -225,125 +364,99 @@ class MediaItem:
             media_items = conn.execute('SELECT id, category, title, release_date, poster_path, entry_updated FROM media_items ORDER BY entry_updated DESC LIMIT ?', (limit,)).fetchall()
         
 
-        items = []
-
-        for item in media_items:
-            media_item = cls(**dict(item))
-
-
-            # Get genres for this media item (joining media_genres and genres)
-            genres_data = conn.execute('''
-                SELECT g.genre 
-                FROM media_genres mg
-                JOIN genres g ON mg.genre_id = g.id
-                WHERE mg.media_item_id = ?''', (media_item.id,)).fetchall()
-            genres = [genre['genre'] for genre in genres_data]
-            media_item.genres = genres
-
-
-            items.append(media_item)
+        items = MediaCard.hydrate(conn, media_items)
 
         conn.close()
         return items
 
     @classmethod
-    def load_recently_added_page_with_limit_and_offset(cls, limit, offset):
-        conn = cls.get_db_connection()
-
-        # Modified SQL query to include both LIMIT and OFFSET
-        media_items = conn.execute(
-            'SELECT id, category, title, release_date, description, poster_path, entry_updated '
-            'FROM media_items ORDER BY entry_updated DESC LIMIT ? OFFSET ?',
-            (limit, offset)
-        ).fetchall()
-
-        items = []
-
-        for item in media_items:
-            media_item = cls(**dict(item))
+    def load_recently_added_page_with_limit_and_offset(cls, limit, offset, page_token=None):
+        # ORDER BY entry_updated DESC, id DESC -- idx_media_items_updated (rowid is the implicit tie-break)
+        return cls.load_page('entry_updated', limit, offset, page_token)
 
+    @classmethod
+    def load_movies_only_with_limit_and_offset(cls, limit, offset, page_token=None):
+        # ORDER BY title DESC, id DESC -- idx_media_items_category_title
+        return cls.load_page('title', limit, offset, page_token, category='movie')
 
-            # Get genres for this media item (joining media_genres and genres)
-            genres_data = conn.execute('''
-                SELECT g.genre 
-                FROM media_genres mg
-                JOIN genres g ON mg.genre_id = g.id
-                WHERE mg.media_item_id = ?''', (media_item.id,)).fetchall()
-            genres = [genre['genre'] for genre in genres_data]
-            media_item.genres = genres
-
-
-            items.append(media_item)        
-        conn.close()
-
-        # Convert to list of Media objects
-        return items
+    @classmethod
+    def load_series_only_with_limit_and_offset(cls, limit, offset, page_token=None):
+        # ORDER BY title DESC, id DESC -- idx_media_items_category_title
+        return cls.load_page('title', limit, offset, page_token, category='series')
 
     @classmethod
-    def load_movies_only_with_limit_and_offset(cls, limit, offset):
+    def load_page(cls, column, limit, offset, page_token=None, category=None):
+        """
+        Keyset (seek) pagination over media_items ordered by `column` DESC, id DESC.
+
+        With a valid page_token the page is read straight from the index after the token's key.
+        Without one (plain ?page=N links) the key of the row just before the page is located
+        on the covering (category, column, id) index first, so no table rows are skipped over.
+        """
         conn = cls.get_db_connection()
 
-        # Modified SQL query to include both LIMIT and OFFSET
-        media_items = conn.execute(
-            'SELECT id, category, title, release_date, description, poster_path, entry_updated '
-            'FROM media_items WHERE category = "movie" ORDER BY title DESC LIMIT ? OFFSET ?',
-            (limit, offset)
-        ).fetchall()
-
-        items = []
-
-        for item in media_items:
-            media_item = cls(**dict(item))
-
-
-            # Get genres for this media item (joining media_genres and genres)
-            genres_data = conn.execute('''
-                SELECT g.genre 
-                FROM media_genres mg
-                JOIN genres g ON mg.genre_id = g.id
-                WHERE mg.media_item_id = ?''', (media_item.id,)).fetchall()
-            genres = [genre['genre'] for genre in genres_data]
-            media_item.genres = genres
-
-
-            items.append(media_item)        
+        key, direction = decode_page_token(page_token, column)
+        if key is not None:
+            offset = 0
+        elif offset > 0:
+            anchor = cls._page_anchor(conn, column, offset, category)
+            if anchor is None:
+                conn.close()
+                return []
+            # title and entry_updated are always set on ingest; a NULL key can't be seeked past, so keep the offset then
+            if anchor[0] is not None:
+                key, offset = anchor, 0
+
+        where = []
+        params = []
+        if category:
+            where.append('category = ?')
+            params.append(category)
+        if key is not None:
+            seek_sql, seek_params = seek_condition(column, key, direction)
+            where.append(seek_sql)
+            params.extend(seek_params)
+
+        order = 'ASC' if direction == 'prev' else 'DESC'
+        query = (
+            f'SELECT {CARD_COLUMNS} '
+            'FROM media_items '
+            f'{"WHERE " + " AND ".join(where) if where else ""} '
+            f'ORDER BY {column} {order}, id {order} LIMIT ? OFFSET ?'
+        )
+        media_items = conn.execute(query, (*params, limit, offset)).fetchall()
+        if direction == 'prev':
+            media_items.reverse()
+
+        items = MediaCard.hydrate(conn, media_items)
         conn.close()
 
-        # Convert to list of Media objects
         return items
 
-    @classmethod
-    def load_series_only_with_limit_and_offset(cls, limit, offset):
-        conn = cls.get_db_connection()
-
-        # Modified SQL query to include both LIMIT and OFFSET
-        media_items = conn.execute(
-            'SELECT id, category, title, release_date, description, poster_path, entry_updated '
-            'FROM media_items WHERE category = "series" ORDER BY title DESC LIMIT ? OFFSET ?',
-            (limit, offset)
-        ).fetchall()
-
-        items = []
-
-        for item in media_items:
-            media_item = cls(**dict(item))
-
-
-            # Get genres for this media item (joining media_genres and genres)
-            genres_data = conn.execute('''
-                SELECT g.genre 
-                FROM media_genres mg
-                JOIN genres g ON mg.genre_id = g.id
-                WHERE mg.media_item_id = ?''', (media_item.id,)).fetchall()
-            genres = [genre['genre'] for genre in genres_data]
-            media_item.genres = genres
-
-
-            items.append(media_item)        
-        conn.close()
+    @staticmethod
+    def _page_anchor(conn, column, offset, category=None):
+        """Return the (value, id) key of the row right before `offset`, read from the index only."""
+        if category:
+            row = conn.execute(
+                f'SELECT {column}, id FROM media_items WHERE category = ? ORDER BY {column} DESC, id DESC LIMIT 1 OFFSET ?',
+                (category, offset - 1)
+            ).fetchone()
+        else:
+            row = conn.execute(
+                f'SELECT {column}, id FROM media_items ORDER BY {column} DESC, id DESC LIMIT 1 OFFSET ?',
+                (offset - 1,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
 
-        # Convert to list of Media objects
-        return items
+    @staticmethod
+    def page_tokens(items, column):
+        """Opaque tokens for the pages before and after `items` (a page loaded by load_page)."""
+        if not items:
+            return None, None
+        first, last = items[0], items[-1]
+        prev_token = encode_page_token(column, getattr(first, column), first.id, 'prev')
+        next_token = encode_page_token(column, getattr(last, column), last.id, 'next')
+        return prev_token, next_token
     
     
     @classmethod
@@ -390,30 +503,28 @@ class MediaItem:
             return f"{int(avg_hours)}hr {int(avg_remaining_minutes)}min" if avg_hours > 0 else f"{int(avg_remaining_minutes)}min"
 
     @classmethod
-    def search(cls, input_str):
+    def search(cls, input_str, limit=SEARCH_RESULT_LIMIT):
+        """bm25 ranked full-text search over title, tagline, description, studio and genres (see create_search_index)."""
         conn = cls.get_db_connection()
         cursor = conn.cursor()
-        
-        items = cursor.execute("SELECT * FROM media_items WHERE title LIKE ?", ('%' + input_str + '%',)).fetchall()
-        
-
-        items_list = []
 
-        for item in items:
-            media_item = cls(**dict(item))
-
-
-            # Get genres for this media item (joining media_genres and genres)
-            genres_data = conn.execute('''
-                SELECT g.genre 
-                FROM media_genres mg
-                JOIN genres g ON mg.genre_id = g.id
-                WHERE mg.media_item_id = ?''', (media_item.id,)).fetchall()
-            genres = [genre['genre'] for genre in genres_data]
-            media_item.genres = genres
+        tokenizer = search_tokenizer(conn)
+        match_query = build_match_query(input_str, tokenizer)
+
+        if match_query:
+            items = cursor.execute('''
+                SELECT mi.id, mi.category, mi.title, mi.release_date, mi.description, mi.poster_path, mi.entry_updated
+                FROM media_search
+                JOIN media_items mi ON mi.id = media_search.rowid
+                WHERE media_search MATCH ?
+                ORDER BY bm25(media_search, 10.0, 2.0, 1.0, 1.0, 2.0)
+                LIMIT ?''', (match_query, limit)).fetchall()
+        else:
+            # No FTS5, or a query too short for trigrams -- title substring match, capped
+            items = cursor.execute(f"SELECT {CARD_COLUMNS} FROM media_items WHERE title LIKE ? LIMIT ?", ('%' + input_str + '%', limit)).fetchall()
 
 
-            items_list.append(media_item)
+        items_list = MediaCard.hydrate(conn, items)
         conn.close()
 
         return items_list
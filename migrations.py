@@ -0,0 +1,208 @@
+import os
+import time
+import shutil
+
+from db_connect import get_db_connection
+from database_create import (
+    create_indexes, create_media_counts, repair_media_counts, create_search_index, rebuild_search_index
+)
+
+
+# Schema migrations, applied in order and recorded in PRAGMA user_version.
+# Never edit or reorder a released migration -- append a new one instead.
+# Each runs inside its own transaction; statements should be idempotent, a fresh
+# database created by create() passes through all of them too.
+
+
+def _deduplicate(cursor, table, columns, keep='MIN'):
+    """Delete duplicate rows over `columns`, keeping the MIN (or MAX) id, so a UNIQUE index can be built."""
+    cursor.execute(f'''
+        DELETE FROM {table}
+        WHERE id NOT IN (SELECT {keep}(id) FROM {table} GROUP BY {columns})
+    ''')
+    if cursor.rowcount:
+        print(f'[ info ] Removed {cursor.rowcount} duplicate rows from {table} ({columns})')
+
+
+def migration_001_hot_path_indexes(cursor):
+    # Delete triggers and MediaItem.load_by_id look media_metadata up by media_item_id
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_media_metadata_media_item_id ON media_metadata (media_item_id, season, episode);')
+
+    # Season / episode lookups in insert_tv_series and tmdb updates
+    _deduplicate(cursor, 'tv_seasons', 'media_item_id, season')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_tv_seasons_item_season ON tv_seasons (media_item_id, season);')
+    _deduplicate(cursor, 'tv_episodes', 'media_item_id, season, episode')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_tv_episodes_item_season_episode ON tv_episodes (media_item_id, season, episode);')
+
+    # User state -- one row per user and item, the submit_* routes update it in place
+    _deduplicate(cursor, 'user_profile', 'user_id, media_item_id', keep='MAX')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_user_profile_user_item ON user_profile (user_id, media_item_id);')
+    _deduplicate(cursor, 'user_profile_items', 'user_id, media_metadata_id', keep='MAX')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_user_profile_items_user_metadata ON user_profile_items (user_id, media_metadata_id);')
+
+
+def migration_002_listing_and_search(cursor):
+    # Pagination indexes, media_counts and the FTS5 search index for databases created before them
+    create_indexes(cursor)
+    create_media_counts(cursor)
+    repair_media_counts(cursor)
+    if create_search_index(cursor):
+        rebuild_search_index(cursor)
+
+
+def migration_003_analyze(cursor):
+    # Planner statistics for the indexes above (also enables skip-scan on the low cardinality user_id columns)
+    cursor.execute('ANALYZE')
+
+
+def migration_004_file_state(cursor):
+    # Stat signature -> file_hash_key of every scanned file, see file_state.FileStateIndex
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_state (
+            path TEXT PRIMARY KEY,              -- same form as media_metadata.path
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NULL,
+            device INTEGER NULL,
+            file_hash_key TEXT NOT NULL,
+            checked_at TEXT DEFAULT (datetime('now'))
+        )
+    ''')
+
+
+def migration_005_dir_state(cursor):
+    # Directory mtime -> listing of every scanned directory, see file_state.DirectoryIndex
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dir_state (
+            path TEXT PRIMARY KEY,              -- normalised directory path
+            mtime_ns INTEGER NOT NULL,
+            files TEXT NOT NULL,                -- JSON list of video file names directly in the directory
+            subdirs TEXT NOT NULL,              -- JSON list of subdirectory names
+            checked_at TEXT DEFAULT (datetime('now'))
+        )
+    ''')
+
+
+def migration_006_fingerprint_v2(cursor):
+    # Re-key media_metadata from the MD5-of-the-first-2MB file_hash_key to the sampled blake2b fingerprint
+    # (extract_metadata.get_file_hash). Only the sampled windows are read, nothing is re-ingested.
+    from hashing import get_hashing_service
+    from extract_metadata import FINGERPRINT_VERSION, KEYFRAME_FOLDER
+
+    # Old keys stay resolvable, bookmarked /watch?path=<old key> links redirect to the new one
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_hash_aliases (
+            old_key TEXT PRIMARY KEY,
+            file_hash_key TEXT NOT NULL
+        )
+    ''')
+
+    prefix = f'v{FINGERPRINT_VERSION}_'
+    rows = cursor.execute('''
+        SELECT id, path, file_hash_key, key_frame FROM media_metadata
+        WHERE file_hash_key NOT LIKE ? || '%' AND path IS NOT NULL
+    ''', (prefix,)).fetchall()
+    if not rows:
+        return
+
+    entries = ((os.path.basename(row[1]), os.path.dirname(row[1]), row) for row in rows)
+    rekeyed = unreadable = 0
+    for result in get_hashing_service().hash_files(entries):
+        media_metadata_id, path, old_key, key_frame = result.tag
+        if result.error is not None:
+            unreadable += 1     # keeps its old key; a later scan treats it as missing / new
+            continue
+
+        new_key = result.file_hash_key
+        clash = cursor.execute('SELECT 1 FROM media_metadata WHERE file_hash_key = ?', (new_key,)).fetchone()
+        if clash:
+            print(f'[ warning ] "{path}" has the same fingerprint as another entry, keeping its old key')
+            continue
+
+        # Keyframes are named after the key. Hard link (or copy) rather than rename, so a rollback of
+        # this migration leaves the old names working.
+        if key_frame == f'keyframe_{old_key}.jpg':
+            new_key_frame = f'keyframe_{new_key}.jpg'
+            old_file = os.path.join(KEYFRAME_FOLDER, key_frame)
+            new_file = os.path.join(KEYFRAME_FOLDER, new_key_frame)
+            try:
+                if not os.path.exists(new_file):
+                    try:
+                        os.link(old_file, new_file)
+                    except OSError:
+                        shutil.copy2(old_file, new_file)
+                key_frame = new_key_frame
+            except OSError:
+                pass
+
+        cursor.execute('UPDATE media_metadata SET file_hash_key = ?, key_frame = ? WHERE id = ?',
+                       (new_key, key_frame, media_metadata_id))
+        cursor.execute('INSERT OR REPLACE INTO file_hash_aliases (old_key, file_hash_key) VALUES (?, ?)',
+                       (old_key, new_key))
+        cursor.execute('UPDATE file_state SET file_hash_key = ? WHERE path = ?', (new_key, path))
+        rekeyed += 1
+
+    # Anything else in file_state still carries a version 1 key, let the next scan fingerprint it again
+    cursor.execute("DELETE FROM file_state WHERE file_hash_key NOT LIKE ? || '%'", (prefix,))
+
+    print(f'[ info ] Re-keyed {rekeyed} files to fingerprint v{FINGERPRINT_VERSION} ({unreadable} unreadable)')
+
+
+def migration_007_probe_cache(cursor):
+    # Full ffprobe JSON per file, see probe_cache.ProbeCache
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS probe_cache (
+            file_hash_key TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            probe TEXT NOT NULL,                -- ffprobe -show_format -show_streams output
+            probed_at TEXT DEFAULT (datetime('now'))
+        )
+    ''')
+
+
+MIGRATIONS = [
+    (1, 'hot path indexes and unique constraints', migration_001_hot_path_indexes),
+    (2, 'listing counters, pagination and search indexes', migration_002_listing_and_search),
+    (3, 'analyze', migration_003_analyze),
+    (4, 'file state index', migration_004_file_state),
+    (5, 'directory state index', migration_005_dir_state),
+    (6, 'file_hash_key fingerprint v2', migration_006_fingerprint_v2),
+    (7, 'probe cache', migration_007_probe_cache),
+]
+
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def run_migrations():
+    """Apply every migration newer than the database's user_version, each in its own transaction."""
+    conn = get_db_connection()
+    try:
+        current = get_schema_version(conn)
+        pending = [m for m in MIGRATIONS if m[0] > current]
+        if not pending:
+            print(f'[ info ] Database schema is up to date (version {current}).')
+            return current
+
+        total_start = time.time()
+        for version, description, migrate in pending:
+            start_time = time.time()
+            cursor = conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                migrate(cursor)
+                cursor.execute(f'PRAGMA user_version = {int(version)}')
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f'[ error ] Migration {version} ({description}) failed, database left at version {current}: {e}')
+                raise
+            current = version
+            print(f'[ info ] Migration {version} ({description}) applied in {time.time() - start_time:.3f}s')
+
+        print(f'[ info ] Database migrated to version {current} in {time.time() - total_start:.3f}s')
+        return current
+    finally:
+        conn.close()
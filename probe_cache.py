@@ -0,0 +1,71 @@
+import json
+
+from db_connect import get_db_connection
+from cache import LRUCache, SingleFlight
+
+
+RECENT_PROBES = 256     # probes kept in memory, one ingest asks for the same file several times
+
+
+class ProbeCache:
+    """
+    Full ffprobe output per file (table probe_cache), keyed by file_hash_key and checked against the
+    file's (size, mtime_ns) so an edited file is probed again. The compatibility check, metadata
+    extraction, subtitle selection and keyframe placement all read the same probe.
+    """
+
+    def __init__(self):
+        self._recent = LRUCache(RECENT_PROBES)      # (path, signature): probe
+        self._flight = SingleFlight()
+
+    def get_or_probe(self, path, signature, fingerprint, probe):
+        """
+        path, signature -- the file and its (size, mtime_ns)
+        fingerprint     -- callable() -> file_hash_key, only called on a memory miss
+        probe           -- callable() -> ffprobe JSON as a dict, only called on a cache miss
+        """
+        key = (path, signature)
+        result = self._recent.get(key)
+        if result is not None:
+            return result
+
+        def load():
+            file_hash_key = fingerprint()
+            result = self._load(file_hash_key, signature)
+            if result is None:
+                result = probe()
+                if result.get('streams') or result.get('format'):   # don't remember a failed probe
+                    self._store(file_hash_key, signature, result)
+            self._recent.set(key, result)
+            return result
+
+        return self._flight.do(key, load)
+
+    def _load(self, file_hash_key, signature):
+        conn = get_db_connection()
+        row = conn.execute('SELECT size, mtime_ns, probe FROM probe_cache WHERE file_hash_key = ?',
+                           (file_hash_key,)).fetchone()
+        conn.close()
+        if row is None or (row[0], row[1]) != signature:
+            return None
+        return json.loads(row[2])
+
+    def _store(self, file_hash_key, signature, result):
+        conn = get_db_connection()
+        conn.execute('''
+            INSERT INTO probe_cache (file_hash_key, size, mtime_ns, probe, probed_at)
+            VALUES (?, ?, ?, ?, datetime('now'))
+            ON CONFLICT (file_hash_key) DO UPDATE SET
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                probe = excluded.probe,
+                probed_at = excluded.probed_at
+        ''', (file_hash_key, *signature, json.dumps(result)))
+        conn.commit()
+        conn.close()
+
+    def clear(self):
+        self._recent.clear()
+
+
+probe_cache = ProbeCache()
@@ -0,0 +1,120 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+# In-process progress of scans and ingest, per stage:
+#   queued    -- waiting for the stage
+#   in_flight -- being worked on
+#   done / failed
+# plus the throughput over the last THROUGHPUT_WINDOW seconds and an ETA for what's left.
+# Served as JSON by /api/progress (see app.py) and shown on the settings page.
+THROUGHPUT_WINDOW = 60
+
+
+class StageProgress:
+    def __init__(self, name):
+        self.name = name
+        self.queued = 0
+        self.in_flight = 0
+        self.done = 0
+        self.failed = 0
+        self.first_at = None
+        self.last_at = None
+        self._completions = deque()     # timestamps of recent done / failed
+
+    def _complete(self, now, count):
+        self.first_at = self.first_at or now
+        self.last_at = now
+        self._completions.extend([now] * count)
+
+    def throughput(self, now):
+        """Items per second over the last THROUGHPUT_WINDOW seconds."""
+        while self._completions and self._completions[0] < now - THROUGHPUT_WINDOW:
+            self._completions.popleft()
+        if not self._completions:
+            return 0.0
+        span = min(THROUGHPUT_WINDOW, max(now - self.first_at, 1.0))
+        return len(self._completions) / span
+
+    def snapshot(self, now):
+        rate = self.throughput(now)
+        remaining = self.queued + self.in_flight
+        return {
+            'stage': self.name,
+            'queued': self.queued,
+            'in_flight': self.in_flight,
+            'done': self.done,
+            'failed': self.failed,
+            'throughput': round(rate, 3),
+            'eta_seconds': round(remaining / rate, 1) if rate and remaining else (0 if not remaining else None),
+            'first_activity': self.first_at,
+            'last_activity': self.last_at,
+        }
+
+
+class ProgressRegistry:
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, name):
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = StageProgress(name)
+        return stage
+
+    def register(self, *names):
+        """Pre-create stages so they are listed in this order."""
+        with self._lock:
+            for name in names:
+                self._stage(name)
+
+    def queued(self, name, count=1):
+        with self._lock:
+            self._stage(name).queued += count
+
+    def started(self, name, count=1, from_queue=True):
+        with self._lock:
+            stage = self._stage(name)
+            if from_queue:
+                stage.queued = max(0, stage.queued - count)
+            stage.in_flight += count
+
+    def finished(self, name, count=1, failed=False):
+        with self._lock:
+            stage = self._stage(name)
+            stage.in_flight = max(0, stage.in_flight - count)
+            if failed:
+                stage.failed += count
+            else:
+                stage.done += count
+            stage._complete(time.time(), count)
+
+    @contextmanager
+    def track(self, name, count=1, from_queue=False):
+        """Report a unit of work on a stage -- started on enter, done or failed on exit. Also works as a decorator."""
+        self.started(name, count, from_queue)
+        try:
+            yield
+        except BaseException:
+            self.finished(name, count, failed=True)
+            raise
+        self.finished(name, count)
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            return [stage.snapshot(now) for stage in self._stages.values()]
+
+    def reset(self, name=None):
+        """Zero one stage (keeping its place in the listing), or drop them all."""
+        with self._lock:
+            if name is None:
+                self._stages.clear()
+            else:
+                self._stages[name] = StageProgress(name)
+
+
+progress = ProgressRegistry()
@@ -0,0 +1,54 @@
+from collections import namedtuple
+
+from extract_metadata import get_path
+
+
+# added   -- [(category, file, root)]       new content, needs the full ingest
+# removed -- [file_hash_key]                content no longer found anywhere in the library
+# moved   -- [MovedFile]                    known content found at a new path, only media_metadata.path changes
+LibraryChanges = namedtuple('LibraryChanges', ['added', 'removed', 'moved'])
+MovedFile = namedtuple('MovedFile', ['file_hash_key', 'old_path', 'new_path', 'category', 'file', 'root'])
+
+
+def reconcile(hashed_entries, known):
+    """
+    Diff a stream of scanned files against the database in one pass.
+
+    hashed_entries -- iterable of (category, file, root, file_hash_key), consumed lazily
+                      (e.g. FileStateIndex.hash_entries over library_scanner.iter_library);
+                      file_hash_key is None for a file that couldn't be read
+    known          -- {file_hash_key: path}, e.g. fingerprint_index.fingerprints.snapshot()
+    """
+    added = []
+    candidates = []
+    seen_hashes = set()
+    seen_paths = set()
+    failed_paths = set()
+
+    for category, file, root, file_hash_key in hashed_entries:
+        path = get_path(file, root)
+        seen_paths.add(path)
+
+        if file_hash_key is None:
+            failed_paths.add(path)     # still there, just unreadable right now
+            continue
+
+        if file_hash_key in seen_hashes:
+            continue    # same content twice in the library, the first copy decides
+        seen_hashes.add(file_hash_key)
+
+        known_path = known.get(file_hash_key)
+        if known_path is None:
+            print(f'[ debug ] New entry -- {(file, root)}')
+            added.append((category, file, root))
+        elif known_path != path:
+            candidates.append(MovedFile(file_hash_key, known_path, path, category, file, root))
+
+    # Never remove a file that is still at its known path but couldn't be read this time (locked, share dropped out)
+    removed = [file_hash_key for file_hash_key, path in known.items()
+               if file_hash_key not in seen_hashes and path not in failed_paths]
+
+    # A copy next to a file that is still at its known path is not a move
+    moved = [entry for entry in candidates if entry.old_path not in seen_paths]
+
+    return LibraryChanges(added, removed, moved)
@@ -0,0 +1,45 @@
+// Scan / ingest progress panel on the settings page, refreshed from /api/progress
+const ingestStatusRows = document.querySelector('.ingest-status-rows');
+
+function formatEta(seconds) {
+    if (seconds === null) return '-';
+    if (seconds < 60) return `${Math.round(seconds)}s`;
+    const minutes = Math.floor(seconds / 60);
+    if (minutes < 60) return `${minutes}m ${Math.round(seconds % 60)}s`;
+    return `${Math.floor(minutes / 60)}h ${minutes % 60}m`;
+}
+
+function refreshIngestStatus() {
+    fetch('/api/progress')
+        .then(response => response.json())
+        .then(data => {
+            if (!data.stages.length) return;
+
+            ingestStatusRows.innerHTML = '';
+            data.stages.forEach(stage => {
+                const row = document.createElement('tr');
+                [
+                    stage.stage,
+                    stage.queued,
+                    stage.in_flight,
+                    stage.done,
+                    stage.failed,
+                    stage.throughput.toFixed(2),
+                    formatEta(stage.eta_seconds),
+                ].forEach(value => {
+                    const cell = document.createElement('td');
+                    cell.textContent = value;
+                    row.appendChild(cell);
+                });
+                ingestStatusRows.appendChild(row);
+            });
+        })
+        .catch(error => {
+            console.log('Error:', error);
+        });
+}
+
+if (ingestStatusRows) {
+    refreshIngestStatus();
+    setInterval(refreshIngestStatus, 2000);
+}
@@ -5,6 +5,7 @@ from datetime import datetime
 from db_connect import get_db_connection
 from db_inserts import api_insert_metadata_to_database
 from tmdb_processing import init_api
+from library_state import bump_generation
 
 
 def API_database_update():
@@ -52,6 +53,7 @@ def API_database_update():
             try:
                 api_insert_metadata_to_database(cursor, item_data, item_id, category, year)
                 conn.commit()
+                bump_generation()
 
             except Exception as e:
                 print(f'[ tmdb warning ] Failed to insert to database for {title} _ {e}')        
@@ -4,6 +4,8 @@ import subprocess
 import os
 import json
 
+from ignore_registry import ignored
+
 
 def remove_file_with_retry(file_path, retries=5, delay=1):
     """Attempt to remove a file with retries in case it's being used by another process."""
@@ -21,6 +23,11 @@ def remove_file_with_retry(file_path, retries=5, delay=1):
                 raise
 
 
+def timestamped_outputs(file_path):
+    """Glob for the <name>_<YYYYmmddHHMMSS>.mp4 outputs used when <name>.mp4 is taken."""
+    return os.path.splitext(file_path)[0] + '_' + '[0-9]' * 14 + '.mp4'
+
+
 def convert_to_mp4(file, root):
     if file.endswith(".mp4"):
         return False
@@ -45,12 +52,16 @@ def convert_to_mp4(file, root):
         output_file            # Output file (MP4)
     ]
 
-    # FFmpeg with progress reporting
-    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
+    # Watchdog won't pick up the output or the removal of the original
+    ignored.ignore(file_path, paths=[output_file, file_path], globs=[timestamped_outputs(file_path)])
+    try:
+        # FFmpeg with progress reporting
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
-    # Attempt to remove the original file with retries
-    remove_file_with_retry(file_path)
+        # Attempt to remove the original file with retries
+        remove_file_with_retry(file_path)
+    finally:
+        ignored.release(file_path)
 
 
 
@@ -78,10 +89,6 @@ def transcode_to_mp4_264_aac(file, root):
         output_file = os.path.splitext(file_path)[0] + f"_{timestamp}.mp4"
         print(f'[ debug ] Output file exists, using a unique filename: {output_file}')
 
-    with open('watchdog_temp.txt', 'w') as f:       # Watchdog wont activcate for those files
-        f.writelines([output_file + '\n', file_path + '\n'])
-
-    
     # Command for FFmpeg to convert the video, audio, and subtitle streams
     # Using NVENC (NVIDIA GPU acceleration) for video and AAC for audio encoding
     command = [
@@ -97,37 +104,43 @@ def transcode_to_mp4_264_aac(file, root):
         output_file                 # Output file (MP4)
     ]
 
+    # Watchdog won't pick up the output or the removal of the original. Owned by this job, so several
+    # transcodes can run at once; if the job dies the entries run out with their TTL.
+    ignored.ignore(file_path, paths=[output_file, file_path], globs=[timestamped_outputs(file_path)])
     try:
-        # Using subprocess.Popen to get real-time progress updates from stderr
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
-
-        # Read stderr for progress info
-        while True:
-            stderr_line = process.stderr.readline()
-            if stderr_line == '' and process.poll() is not None:
-                break  
-
-            if stderr_line:
-                # Check for FFmpeg progress lines containing frame, time, fps, bitrate, etc.
-                if 'frame=' in stderr_line:
-                    try:
-                        # Extract frame, fps, time, and bitrate info
-                        frame_info = stderr_line.split('frame=')[-1].split(' ')[0]  # frame count
-                        time_info = stderr_line.split('time=')[-1].split(' ')[0]   # time information
-                        fps_info = stderr_line.split('fps=')[-1].split(' ')[0]     # fps value
-                        bitrate_info = stderr_line.split('bitrate=')[-1].split(' ')[0]  # bitrate info
-                        
-                        # Format the output to match your desired format
-                        print(f'frame={frame_info} fps={fps_info} time={time_info} bitrate={bitrate_info} speed={stderr_line.split("speed=")[-1].split("x")[0]}x -- {file}')
-
-                    except Exception as e:
-                        # Handle any parsing errors
-                        print(f"[ warning ] Could not parse line: {stderr_line}. Error: {e}")
-
-    except Exception as e:
-        print(f"[ error ] An error occurred: {e}")
-
-    remove_file_with_retry(file_path)
+        try:
+            # Using subprocess.Popen to get real-time progress updates from stderr
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+
+            # Read stderr for progress info
+            while True:
+                stderr_line = process.stderr.readline()
+                if stderr_line == '' and process.poll() is not None:
+                    break  
+
+                if stderr_line:
+                    # Check for FFmpeg progress lines containing frame, time, fps, bitrate, etc.
+                    if 'frame=' in stderr_line:
+                        try:
+                            # Extract frame, fps, time, and bitrate info
+                            frame_info = stderr_line.split('frame=')[-1].split(' ')[0]  # frame count
+                            time_info = stderr_line.split('time=')[-1].split(' ')[0]   # time information
+                            fps_info = stderr_line.split('fps=')[-1].split(' ')[0]     # fps value
+                            bitrate_info = stderr_line.split('bitrate=')[-1].split(' ')[0]  # bitrate info
+
+                            # Format the output to match your desired format
+                            print(f'frame={frame_info} fps={fps_info} time={time_info} bitrate={bitrate_info} speed={stderr_line.split("speed=")[-1].split("x")[0]}x -- {file}')
+
+                        except Exception as e:
+                            # Handle any parsing errors
+                            print(f"[ warning ] Could not parse line: {stderr_line}. Error: {e}")
+
+        except Exception as e:
+            print(f"[ error ] An error occurred: {e}")
+
+        remove_file_with_retry(file_path)
+    finally:
+        ignored.release(file_path)
 
     end_time = time.time()
     duration = end_time - start_time
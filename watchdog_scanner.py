@@ -4,15 +4,62 @@ import os
 import queue
 
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from watchdog.events import FileSystemEventHandler, FileCreatedEvent
 
 from directory_manager import load_paths
-from library_manager import verify_library_integrity, remove_missing, check_entries_compatibility, get_hash_list_from_db, process_compatible
-from extract_metadata import get_file_hash
-from queue_tasks import add_to_queue
+from library_manager import remove_paths, apply_path_moves
+from fingerprint_index import fingerprints
+from ignore_registry import ignored
+from file_stability import StabilityDetector
+from hashing import get_hashing_service
+from ingest_pipeline import get_pipeline
 
 from threading import Timer
 
+
+# Deletes / moves arriving within this many seconds of each other are applied to the library in one batch
+COALESCE_SECONDS = 2
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv", ".webm")
+
+
+class EventBatcher:
+    """Collects events and hands them to handler(list) in arrival order once no new one came in for a while."""
+
+    def __init__(self, handler, delay=COALESCE_SECONDS):
+        self.handler = handler
+        self.delay = delay
+        self.items = []
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def add(self, item):
+        with self.lock:
+            self.items.append(item)
+            if self.timer:
+                self.timer.cancel()
+            self.timer = Timer(self.delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            items, self.items = self.items, []
+            self.timer = None
+        if not items:
+            return
+        try:
+            self.handler(items)
+        except Exception as e:
+            print(f"[ warning ] Could not apply {len(items)} watcher event(s): {e}")
+
+
+def remove_deleted(paths):
+    # A folder delete reports the folder and every file in it, the folder alone covers them
+    folders = sorted({os.path.normpath(path) for path in paths})
+    remove_paths([path for path in folders if not any(path.startswith(folder + os.sep) for folder in folders)])
+
+
 class MovieWatcher(FileSystemEventHandler):
     """Watchdog event handler to monitor movie and series folders."""
 
@@ -27,6 +74,12 @@ class MovieWatcher(FileSystemEventHandler):
         self.series_paths = self.paths.get("series", [])
         self.movies_paths = self.paths.get("movies", [])
 
+        # Deletes and moves are resolved by path and applied in batches
+        self.deletions = EventBatcher(remove_deleted)
+        self.moves = EventBatcher(self._apply_moves)
+        # New files wait here until they stop changing
+        self.stability = StabilityDetector.from_settings()
+
         # Create worker threads to process files in the queue
         self.worker_threads = []
         for _ in range(3):  # number of worker threads
@@ -41,69 +94,47 @@ class MovieWatcher(FileSystemEventHandler):
             file_path, event = self.file_queue.get()  # Block until a file is added to the queue
             if file_path is None:
                 break  # Exit if a None value is received
-            self.process_new_file(file_path, event)
-            self.file_queue.task_done()
+            try:
+                self.process_new_file(file_path, event)
+            except Exception as e:
+                # One bad file (gone mid-hash, a database error) mustn't take the worker down with it
+                print(f"[ warning ] Could not process new file {file_path}: {e}")
+            finally:
+                self.file_queue.task_done()
 
 
     def _handle_file_creation(self, event):
         """Handle file creation event."""
-        with open('watchdog_temp.txt', 'r') as f:
-            lines = f.readlines()
-        lines = [line.strip() for line in lines]
-        lines = [os.path.normpath(line) for line in lines]
-        normalized_path = os.path.normpath(event.src_path)
-
-        # Check if the event's file path is already in the lines
-        if normalized_path in lines:
+        # Written by one of our own jobs (e.g. a transcode output)
+        if ignored.is_ignored(event.src_path):
             return True
 
-
-        hash_list = get_hash_list_from_db()
         file = os.path.basename(event.src_path)
         root = os.path.dirname(event.src_path)
 
         try: 
-            hash = get_file_hash(file, root)
+            hash = get_hashing_service().hash_file(file, root)
         except PermissionError:
             return False    # Return False if there's a PermissionError 
 
         # Check if the event's file hash key is already in database
-        if hash in hash_list:
+        if hash in fingerprints:
             return True
         
         print(f"[+] New file detected: {event.src_path}")
-        item = [(self._get_directory_type(event.src_path), file, root)]
-        compatible_files, incompatible_files = check_entries_compatibility(item)
-
-        if compatible_files:
-            for file in compatible_files:
-                # Process compatible files in a new thread to prevent blocking
-                threading.Thread(target=process_compatible, args=(file,), daemon=True).start()
-
-        if incompatible_files:
-            for file in incompatible_files:
-                # Add incompatible files to the queue for further processing
-                threading.Thread(target=add_to_queue, args=(file,), daemon=True).start()
+        # Probe, subtitles, transcode, keyframe, insert and tmdb lookup all happen in the ingest pipeline
+        get_pipeline().submit(self._get_directory_type(event.src_path), file, root, hash)
 
         return True
     
     def _handle_file_deletion(self, event):
         """Handle file deletion event."""
-        with open('watchdog_temp.txt', 'r') as f:
-            lines = f.readlines()
-        lines = [line.strip() for line in lines]
-        lines = [os.path.normpath(line) for line in lines]
-        normalized_path = os.path.normpath(event.src_path)
-        
-        # Check if the event's file path is already in the lines
-        if normalized_path in lines:
+        # Removed by one of our own jobs (e.g. the original of a transcode)
+        if ignored.is_ignored(event.src_path):
             return
         
         print(f"[-] File deleted: {event.src_path}")
-        # Implement removal logic here
-        new_entries_list, missing_entries_list = verify_library_integrity('movies', 'series')
-        if missing_entries_list:
-            remove_missing(missing_entries_list)
+        self.deletions.add(event.src_path)
 
     def _get_directory_type(self, path):
         """Determine if the path is a 'series' or 'movies' directory."""
@@ -113,34 +144,15 @@ class MovieWatcher(FileSystemEventHandler):
             return "movies"
         return "unknown"
     
-    def wait_for_file(self, file_path, retries=10, wait_time=1):
-        """Wait for the file to be available (not in use) before processing."""
-        for _ in range(retries):
-            if os.path.exists(file_path) and os.access(file_path, os.R_OK):
-                return True
-            time.sleep(wait_time)
-        return False
-    
     def process_new_file(self, file_path, event):
-        """Process the new file"""
-        if self.wait_for_file(file_path):
-            # Retry _handle_file_creation only if a PermissionError occurs while getting file hash
-            result = self._handle_file_creation(event)
-            if result:  # File handled successfully
-                pass
-            else:
-                print(f"Permission error: Could not access file hash for {file_path}. Retrying...")
-                # Retry file handling if there was a PermissionError
-                retries = 5  # Number of retries in case of PermissionError
-                for _ in range(retries):
-                    time.sleep(2)  # Wait for a moment before retrying
-                    result = self._handle_file_creation(event)
-                    if result:
-                        break
-                else:
-                    print(f"Failed to access file after {retries} retries: {file_path}")
-        else:
-            print(f"File {file_path} is not ready for processing.")
+        """Process the new file, once file_stability has seen it stop changing."""
+        if not self._handle_file_creation(event):
+            # It was readable when it settled, so something grabbed it again -- wait for it to settle once more
+            print(f"[ warning ] Could not read {file_path}, waiting for it to settle again")
+            self._queue_when_stable(file_path, event)
+
+    def _queue_when_stable(self, file_path, event):
+        self.stability.watch(file_path, lambda path: self.file_queue.put((path, event)))
 
     def on_created(self, event):
         """Handle file creation event."""
@@ -149,9 +161,11 @@ class MovieWatcher(FileSystemEventHandler):
             print(f"[!] Unknown directory type for file: {event.src_path}")
             return
         
-        if event.src_path.endswith((".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv", ".webm")):
-            # Process the file (wait for it to be ready)
-            self.file_queue.put((event.src_path, event))  # Add to queue for processing
+        if event.src_path.endswith(VIDEO_EXTENSIONS):
+            if ignored.is_ignored(event.src_path):
+                return      # e.g. a transcode output, still being written by us
+            # Queued for processing once it's completely written (copies and downloads take a while)
+            self._queue_when_stable(event.src_path, event)
             
 
     def on_deleted(self, event):
@@ -161,10 +175,47 @@ class MovieWatcher(FileSystemEventHandler):
             print(f"[!] Unknown directory type for file: {event.src_path}")
             return
         
-        if event.src_path.endswith((".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv", ".webm")):
-            self._handle_file_deletion(event)
-        else:
-            self._handle_file_deletion(event)
+        # Folders too -- everything below them goes in the same batch
+        self._handle_file_deletion(event)
+
+    def on_moved(self, event):
+        """Handle rename / move of a file or folder."""
+        if ignored.is_ignored(event.src_path) or ignored.is_ignored(event.dest_path):
+            return
+
+        src_type = self._get_directory_type(event.src_path)
+        dest_type = self._get_directory_type(event.dest_path)
+        if dest_type == "unknown":
+            # Moved out of the libraries
+            if src_type != "unknown":
+                self._handle_file_deletion(event)
+            return
+        if src_type == "unknown":
+            # Moved in from elsewhere, same as a new file
+            if not event.is_directory:
+                self.on_created(FileCreatedEvent(event.dest_path))
+            return
+
+        print(f"[~] Moved: {event.src_path} -> {event.dest_path}")
+        self.moves.add((event.src_path, event.dest_path, src_type, dest_type, event.is_directory))
+
+    def _apply_moves(self, moves):
+        # A folder move also reports every file in it, the folder alone covers them
+        folders = [(os.path.normpath(src), os.path.normpath(dest)) for src, dest, _, _, is_directory in moves if is_directory]
+        moves = [move for move in moves if not any(
+            os.path.normpath(move[0]).startswith(src + os.sep) and os.path.normpath(move[1]).startswith(dest + os.sep)
+            for src, dest in folders)]
+
+        reingest, unmatched = apply_path_moves([move[:4] for move in moves])
+
+        # Renamed to a different title or moved to the other library -- ingest again
+        for category, file, root, file_hash_key in reingest:
+            get_pipeline().submit(category, file, root, file_hash_key)
+
+        # Not in the library yet, e.g. a download renamed from its temp name once finished
+        for src, dest, _, _ in unmatched:
+            if dest.endswith(VIDEO_EXTENSIONS) and os.path.isfile(dest):
+                self.on_created(FileCreatedEvent(dest))
 
 
 